@@ -0,0 +1,234 @@
+import numpy
+import threading
+from collections import OrderedDict
+import postfix
+
+# zeros, local extrema and pairwise intersections of y = f(x) curves over a view. every curve is sampled once on a
+# shared grid of one sample per pixel column; sign changes on that grid bracket the answers, and all brackets are
+# refined together, so each iteration calls each curve once, on every point that belongs to it.
+
+def finiteDifference(callArray):
+    # central difference, for the expressions differentiateTree cannot handle
+    def derivative(xs):
+        step = numpy.sqrt(numpy.finfo(float).eps) * numpy.maximum(numpy.abs(xs), 1)
+        return (callArray(xs + step) - callArray(xs - step)) / (2 * step)
+    return derivative
+
+def getDerivatives(function):
+    # array callables for the first and second derivative, symbolic where possible
+    names = tuple(postfix.classifyVars(function.expression)) or ("x",)
+    calls = []
+    expression, call = function.expression, function.callArray
+    for _ in range(2):
+        try:
+            expression = postfix.differentiatePostfix(expression, names[0])
+            call = postfix.compilePostfixBatch(expression, names[:1])
+        except ValueError:
+            expression, call = None, finiteDifference(call)
+        calls.append(call)
+        if expression is None:
+            calls.append(finiteDifference(call))
+            break
+    return calls[0], calls[1]
+
+class batch:
+    # points grouped by the curve they belong to, so evaluating calls each curve once, on all of its points
+    def __init__(self, owners, count):
+        self.order = numpy.argsort(owners, kind="stable")
+        self.bounds = numpy.searchsorted(owners[self.order], numpy.arange(count + 1))
+
+    def add(self, calls, xs, out):
+        for index, call in enumerate(calls):
+            start, stop = self.bounds[index], self.bounds[index + 1]
+            if start < stop:
+                points = self.order[start:stop]
+                out[points] += call(xs[points])
+        return out
+
+class system:
+    # g(x) = f_first(x) - f_second(x), or just f_first(x) without `second`, with its slope, for many brackets at once.
+    # both terms go through one batch, so each curve is still called once per evaluation
+    def __init__(self, calls, slopes, first, second=None):
+        self.calls = calls
+        self.slopes = slopes
+        self.paired = second is not None
+        self.batch = batch(numpy.concatenate((first, second)) if self.paired else first, len(calls))
+
+    def evaluate(self, xs, calls=None):
+        points = numpy.concatenate((xs, xs)) if self.paired else xs
+        out = self.batch.add(calls or self.calls, points, numpy.zeros_like(points))
+        return out[:len(xs)] - out[len(xs):] if self.paired else out
+
+    def slope(self, xs):
+        return self.evaluate(xs, self.slopes)
+
+def refine(g, lo, hi, gLo, tolerance, iterations=30):
+    # safeguarded newton: steps that land inside the bracket are taken, the rest bisect, and the bracket
+    # always shrinks around the sign change. stops once every point is within `tolerance`
+    with numpy.errstate(all="ignore"):
+        xs = (lo + hi) / 2
+        for _ in range(iterations):
+            gx = g.evaluate(xs)
+            below = numpy.signbit(gx) == numpy.signbit(gLo)
+            lo, gLo, hi = numpy.where(below, xs, lo), numpy.where(below, gx, gLo), numpy.where(below, hi, xs)
+            step = xs - gx / g.slope(xs)
+            done = (gx == 0) | (numpy.abs(step - xs) < tolerance) | (hi - lo < tolerance)
+            xs = numpy.where(done, xs, numpy.where((step > lo) & (step < hi), step, (lo + hi) / 2))
+            if done.all():
+                break
+    return xs
+
+def bracket(values):
+    # (row, column) of every interval of a sample row where it changes sign, plus samples that are exactly zero
+    # between two of opposite sign. a row that is zero over a run, like a curve compared with itself, has no single
+    # crossing to mark, and one that only touches zero is left to the extrema
+    # sign bits narrow it down cheaply, and only those candidates are checked for zeros and undefined values.
+    # flat indices are found much faster than numpy.nonzero's (row, column) pairs
+    signs = numpy.signbit(values)
+    rows, columns = numpy.divmod(numpy.flatnonzero(signs[:, :-1] != signs[:, 1:]), values.shape[1] - 1)
+    zeroRows, zeroColumns = numpy.divmod(numpy.flatnonzero(values == 0), values.shape[1])
+    inner = (zeroColumns > 0) & (zeroColumns < values.shape[1] - 1)
+    zeroRows, zeroColumns = zeroRows[inner], zeroColumns[inner]
+    with numpy.errstate(all="ignore"):
+        crossing = values[rows, columns] * values[rows, columns + 1] < 0
+        through = values[zeroRows, zeroColumns - 1] * values[zeroRows, zeroColumns + 1] < 0
+    return rows[crossing], columns[crossing], zeroRows[through], zeroColumns[through]
+
+def getEmpty(curves=()):
+    empty = (numpy.empty(0),) * 2 + (numpy.empty(0, dtype=int),) * 2
+    results = dict.fromkeys(("roots", "minima", "maxima", "intersections"), empty)
+    results.update(curves=curves, version=0)
+    return results
+
+class analyzer:
+    # results per view and set of curves, least-recently-used first
+    maxEntries = 16
+
+    def __init__(self, maxEntries=None):
+        self.maxEntries = maxEntries or self.maxEntries
+        self.entries = OrderedDict() # (view, curves): results
+        self.derivatives = {} # id(function): (function, revision, first derivative, second derivative)
+        self.last = None
+        self.version = 0
+        self.lock = threading.Lock()
+        self.wanted = None # (key, functions) to search next, off the render thread
+        self.searching = None # key being searched there
+        self.failed = None # key whose search raised, so it is not queued again every frame
+
+    def getDerivatives(self, function):
+        owner, revision, first, second = self.derivatives.get(id(function), (None, None, None, None))
+        if owner is not function or revision != function.revision:
+            first, second = getDerivatives(function)
+            self.derivatives[id(function)] = (function, function.revision, first, second)
+        return first, second
+
+    def analyze(self, functions, left, right, columns, yTolerance, reuse=False, run=None):
+        # {"roots", "minima", "maxima", "intersections": (xs, ys, first curve, second curve)} over [left, right],
+        # sampled once per column. an answer counts if it is within `yTolerance` of exact, which rejects the
+        # sign changes across poles. `reuse` returns the last results for these curves whatever the view, e.g. mid-drag.
+        # with `run`, which does a job off the render thread (samplingPool.run), a view not searched yet is queued
+        # there instead of searched here, and the last results for these curves stand in until it is done
+        curves = tuple((id(f), f.revision) for f in functions)
+        key = (left, right, columns, yTolerance), curves
+        with self.lock:
+            if reuse and self.last is not None and self.last["curves"] == curves:
+                return self.last
+            results = self.entries.get(key)
+            if results is not None:
+                self.entries.move_to_end(key)
+                self.last = results
+                return results
+            if run is not None:
+                if key not in (self.searching, self.failed):
+                    self.wanted = key, functions
+                    if self.searching is None:
+                        self.searching = key
+                        run(self.search)
+                return self.last if self.last is not None and self.last["curves"] == curves else getEmpty(curves)
+        return self.store(key, functions, self.find(functions, left, right, columns, yTolerance))
+
+    def store(self, key, functions, results):
+        with self.lock:
+            live = {id(f) for f in functions}
+            self.derivatives = {key: value for key, value in self.derivatives.items() if key in live}
+            self.version += 1
+            results.update(curves=key[1], version=self.version)
+            self.entries[key] = results
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+            self.last = results
+        return results
+
+    def search(self):
+        # on a worker: the newest view asked for, then whichever was asked for meanwhile, until none is waiting
+        while True:
+            with self.lock:
+                if self.wanted is None:
+                    self.searching = None
+                    return
+                key, functions = self.wanted
+                self.searching, self.wanted = key, None
+            results = None
+            try:
+                results = self.find(functions, *key[0])
+            finally:
+                if results is None:
+                    with self.lock:
+                        self.failed, self.searching = key, None
+            self.store(key, functions, results)
+
+    def find(self, functions, left, right, columns, yTolerance):
+        results = getEmpty()
+        if not functions or right <= left:
+            return results
+        count = len(functions)
+        xs = numpy.linspace(left, right, columns + 1)
+        tolerance = (right - left) / columns * 1e-6
+        slopeTolerance = yTolerance * columns / (right - left) # the slope that rises `yTolerance` over a column
+        calls = [f.callArray for f in functions]
+        derivatives = [self.getDerivatives(f) for f in functions]
+        firsts = [first for first, _ in derivatives]
+        seconds = [second for _, second in derivatives]
+        with numpy.errstate(all="ignore"):
+            values = numpy.array([call(xs) for call in calls])
+            slopes = numpy.array([first(xs) for first in firsts])
+
+        def solve(g, samples, limit):
+            # (x, row, whether the row was negative before it) for every crossing within `limit` of zero, and exact zero
+            rows, cols, zeroRows, zeroCols = bracket(samples)
+            found = refine(g(rows), xs[cols], xs[cols + 1], samples[rows, cols], tolerance)
+            with numpy.errstate(all="ignore"):
+                keep = numpy.abs(g(rows).evaluate(found)) <= limit
+            falling = numpy.concatenate((samples[rows, cols] < 0, samples[zeroRows, numpy.maximum(zeroCols - 1, 0)] < 0))
+            keep = numpy.concatenate((keep, numpy.ones(len(zeroRows), dtype=bool)))
+            found = numpy.concatenate((found, xs[zeroCols]))
+            return found[keep], numpy.concatenate((rows, zeroRows))[keep], falling[keep]
+
+        def evaluate(calls, owners, points):
+            with numpy.errstate(all="ignore"):
+                return batch(owners, count).add(calls, points, numpy.zeros_like(points))
+
+        # zeros of each curve, then its extrema as zeros of its slope. an extremum that touches zero is a double root,
+        # which has no sign change of its own. a slope that was negative before its zero is a minimum
+        roots, owners, _ = solve(lambda rows: system(calls, firsts, rows), values, yTolerance)
+        extrema, extremaOwners, minimum = solve(lambda rows: system(firsts, seconds, rows), slopes, slopeTolerance)
+        extremaValues = evaluate(calls, extremaOwners, extrema)
+        touching = numpy.abs(extremaValues) <= yTolerance
+        roots = numpy.concatenate((roots, extrema[touching]))
+        owners = numpy.concatenate((owners, extremaOwners[touching]))
+        results["roots"] = (roots, numpy.zeros_like(roots), owners, owners)
+        for name, side in (("minima", minimum), ("maxima", ~minimum)):
+            results[name] = (extrema[side], extremaValues[side], extremaOwners[side], extremaOwners[side])
+
+        # every pair at once, as a row of differences per pair; a curve at a time against the curves after it, which
+        # is much cheaper than gathering both sides of every pair
+        first, second = numpy.triu_indices(count, 1)
+        if len(first):
+            differences = numpy.empty((len(first), len(xs)))
+            bounds = numpy.searchsorted(first, numpy.arange(count + 1))
+            with numpy.errstate(all="ignore"):
+                for index in range(count - 1):
+                    numpy.subtract(values[index], values[index + 1:], out=differences[bounds[index]:bounds[index + 1]])
+            crossings, pairs, _ = solve(lambda rows: system(calls, firsts, first[rows], second[rows]), differences, yTolerance)
+            results["intersections"] = (crossings, evaluate(calls, first[pairs], crossings), first[pairs], second[pairs])
+        return results
@@ -0,0 +1,481 @@
+import os
+import re
+import sys
+import json
+import timeit
+import tempfile
+import subprocess
+import argparse
+import platform
+import numpy
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import postfix
+import grid
+import tiles
+import camera
+import labels
+import session
+
+benchmarks = {}
+
+def benchmark(func):
+    benchmarks[func.__name__] = func
+    return func
+
+def rate(func, number, repeat=5):
+    # calls per second, best of `repeat`
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return number / best
+
+def milliseconds(func, number, repeat=5):
+    # time per call, best of `repeat`
+    return 1000 / rate(func, number, repeat)
+
+evaluationExpressions = [
+    "x^3",
+    "(1/9x)^2",
+    "2x + 10",
+    "(x^2)/100 - (3x) + 4",
+    "(x+1)*(x+1)",
+]
+
+@benchmark
+def evaluation():
+    xs = range(1, 1001)
+    results = {}
+    for string in evaluationExpressions:
+        expression = postfix.infixToPostfix(postfix.strToInfix(string))
+        interpreted = postfix.getFunctionFromPostfix(expression)
+        compiled = postfix.compilePostfix(expression)
+        if any(interpreted(x) != compiled(x) for x in xs):
+            raise AssertionError(f"compiled `{string}` disagrees with the interpreter")
+        before = rate(lambda: [interpreted(x) for x in xs], 10) * len(xs)
+        after = rate(lambda: [compiled(x) for x in xs], 10) * len(xs)
+        results[string] = {"interpreted": before, "compiled": after, "speedup": after / before}
+    return results
+
+calculationExpressions = [
+    "2 + 3 * 4",
+    "(1/9 * 30)^2 - 4/3",
+    "((2 + 3) * (4 - 1))^2 / (7 - 2) + 10 div 3",
+]
+
+@benchmark
+def calculation():
+    # the stack interpreter on constant expressions, and the same through the compiled-expression cache
+    results = {}
+    for string in calculationExpressions:
+        expression = postfix.infixToPostfix(postfix.strToInfix(string))
+        if postfix.calculatePostfix(expression) != postfix.calculateStr(string):
+            raise AssertionError(f"cached calculation of `{string}` disagrees with the interpreter")
+        results[string] = {
+                "calculations/s": rate(lambda: postfix.calculatePostfix(expression), 10000),
+                "cached/s": rate(lambda: postfix.calculateStr(string), 10000)
+                }
+    return results
+
+@benchmark
+def arrayEvaluation():
+    xs = numpy.arange(-4000, 4001, dtype=float)
+    results = {}
+    for string in evaluationExpressions:
+        expression = postfix.infixToPostfix(postfix.strToInfix(string))
+        compiled = postfix.compilePostfix(expression)
+        batched = postfix.compilePostfixArray(expression)
+        if not numpy.allclose([compiled(x) for x in xs], batched(xs)):
+            raise AssertionError(f"array evaluation of `{string}` disagrees with the scalar path")
+        before = rate(lambda: [compiled(x) for x in xs], 5) * len(xs)
+        after = rate(lambda: batched(xs), 50) * len(xs)
+        results[string] = {"scalar": before, "array": after, "speedup": after / before}
+    return results
+
+@benchmark
+def gridlines():
+    # cost per frame of vertical gridlines as the camera zooms out; the surface stays window sized. then whole frames
+    # of an empty grid, gridlines and labels redrawn each time, which should cost about the same at any zoom
+    g = grid.grid()
+    surface = pygame.Surface((800, 100))
+    results = {}
+    for width in (800, 8000, 80000, 800000):
+        region = grid.projection((-width // 2, -50, width, 100), surface.get_size())
+        count = len(g.getGridlines(region.left, region.right, region.scaleX))
+        frames = rate(lambda: g.drawGridlinesForAxis(region, surface, "x"), 20)
+        view = (-width / 2, -width / 2, width, width)
+        def frame():
+            g.gridLayer.invalidate()
+            g.labelLayer.invalidate()
+            g.render(view, (800, 800))
+        results[f"width {width}"] = {"lines": count, "frames/s": frames, "frame ms": milliseconds(frame, 5)}
+    return results
+
+@benchmark
+def sampling():
+    # evaluations for a cold 800 wide viewport, and the worst on-screen gap between the drawn chords and the curve
+    region = grid.projection((-400, -400, 800, 800))
+    dense = numpy.linspace(region.left, region.right, 64001)
+    results = {}
+    for string in evaluationExpressions:
+        g = grid.grid()
+        g.addFuncFromString(string)
+        function = g.functions[0]
+        _, xs, ys = g.sampleFunctions(region)[0]
+        exact = function.callArray(dense)
+        onScreen = (-region.bottom <= exact) & (exact <= -region.top)
+        error = numpy.max(numpy.abs(numpy.interp(dense, xs, -ys) - exact)[onScreen])
+        frames = rate(lambda: (function.cache.clear(), g.sampleFunctions(region)), 20)
+        results[string] = {"evaluations": function.cache.misses / (1 + 20 * 5), "fixed": region.width + 1,
+                "error px": error, "frames/s": frames}
+    return results
+
+def addCurves(g, count):
+    # `count` distinct curves, cycling through the evaluation expressions with shifted copies
+    for index in range(count):
+        string = evaluationExpressions[index % len(evaluationExpressions)]
+        g.addFuncFromString(f"{string} + {index // len(evaluationExpressions) * 20}")
+
+@benchmark
+def graphing():
+    # a cold frame of curves (caches cleared) and a redraw from cached samples, at several zooms and curve counts
+    results = {}
+    surface = pygame.Surface((800, 800))
+    for width in (80, 800, 8000):
+        region = grid.projection((-width / 2, -width / 2, width, width), surface.get_size())
+        for count in (1, 4, 16):
+            g = grid.grid()
+            addCurves(g, count)
+            def cold():
+                for function in g.functions:
+                    function.cache.clear()
+                g.graphFunctions(region, surface)
+            results[f"width {width}, {count} curves"] = {
+                    "cold ms": milliseconds(cold, 3),
+                    "cached ms": milliseconds(lambda: g.graphFunctions(region, surface), 3)
+                    }
+    return results
+
+@benchmark
+def lineStyles():
+    # drawing one sampled curve in each line style, samples already cached
+    results = {}
+    surface = pygame.Surface((800, 800))
+    region = grid.projection((-400, -400, 800, 800))
+    for name in ("solid", "dotted", "squiggly"):
+        g = grid.grid()
+        g.addFuncFromString("(1/100)x^2 - 100", lineType=getattr(grid.linetype, name), lineWidth=3)
+        g.graphFunctions(region, surface)
+        results[name] = {"ms": milliseconds(lambda: g.graphFunctions(region, surface), 20)}
+    return results
+
+@benchmark
+def labelling():
+    # the horizontal axis labels for one view, with the rendered labels cached and with them thrown away
+    results = {}
+    surface = pygame.Surface((800, 800), pygame.SRCALPHA)
+    region = grid.projection((-400, -400, 800, 800))
+    for interval in (16, 64, 128):
+        g = grid.grid()
+        g.settings.labelXInterval = interval
+        g.labelXAxis(region, surface)
+        def cold():
+            g.labels.labels.clear()
+            g.labelXAxis(region, surface)
+        results[f"interval {interval}"] = {
+                "labels": len(labels.multiplesIn(interval, -400 - interval, 400)),
+                "cold ms": milliseconds(cold, 20),
+                "cached ms": milliseconds(lambda: g.labelXAxis(region, surface), 20)
+                }
+    return results
+
+@benchmark
+def dataSeries():
+    # whole frames of a 10M-sample recording, gridlines and labels included, at full view and zoomed in; values read
+    # per frame should follow the window's columns, not the file's length
+    import series
+    results = {}
+    count = 10_000_000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "series.f32")
+        xs = numpy.arange(count, dtype=numpy.float32)
+        (numpy.sin(xs / 5e5) * 4e6 + numpy.sin(xs) * 1e5).astype(numpy.float32).tofile(path)
+        del xs
+        data = series.dataSeries(path, numpy.float32)
+        g = grid.grid()
+        g.addStyled(data, (0, 0, 255))
+        for name, view in (("full view", (0, -5e6, count, 1e7)), ("zoomed in", (4e6, -5e6, 4000, 1e7))):
+            def frame():
+                g.gridLayer.invalidate()
+                g.labelLayer.invalidate()
+                data.revision = next(grid.revisions) # redrawn every time
+                g.render(view, (800, 800))
+            before = data.countEvaluations()
+            ms = milliseconds(frame, 5)
+            results[name] = {"samples": count, "frame ms": ms, "values/frame": (data.countEvaluations() - before) / 25}
+    return results
+
+def makeCamera(renderable):
+    screen = pygame.Surface((800, 800))
+    return camera.Camera(0, 0, 800, 0.1, 100, renderable, screen.get_size(), screen)
+
+@benchmark
+def frames():
+    # whole frames through Camera.render, as the window would draw them
+    results = {}
+    g = grid.grid()
+    addCurves(g, 4)
+    for name, renderable in (("grid", g), ("tiles", tiles.tileCache(g, prefetch=False))):
+        c = makeCamera(renderable)
+        c.render()
+        results[f"{name} still"] = {"ms": milliseconds(c.render, 20)}
+        def pan():
+            c.position = (c.position[0] + 5, c.position[1])
+            return c.render()
+        results[f"{name} pan"] = {"ms": milliseconds(pan, 20)}
+        def zoom():
+            c.zoomMagnitude = 1200 if c.zoomMagnitude == 800 else 800
+            for function in g.functions:
+                function.cache.clear()
+            return c.render()
+        results[f"{name} zoom"] = {"ms": milliseconds(zoom, 4)}
+        c.interact()
+        c.lastInteraction = float("inf") # stays interactive for the whole run
+        results[f"{name} interactive pan"] = {"ms": milliseconds(pan, 20)}
+    return results
+
+@benchmark
+def analysis():
+    # zeros, extrema and intersections across one view, searched from scratch and found in the cache,
+    # the marker overlay while panning, which reuses the last results, and a frame over a view not searched yet
+    # with a sampling pool, which does the search and leaves the frame only the drawing
+    results = {}
+    region = grid.projection((-400, -400, 800, 800))
+    for count in (1, 10, 50):
+        g = grid.grid()
+        g.settings.showAnalysis = True
+        addCurves(g, count)
+        found = g.getAnalysis(region)
+        def cold():
+            g.analyzer.entries.clear()
+            g.getAnalysis(region)
+        offset = [0]
+        def pan():
+            offset[0] += 5
+            g.renderMarkers((-400 + offset[0], -400, 800, 800), None, True)
+        pooled = grid.grid()
+        pooled.settings.showAnalysis = True
+        pooled.pool = grid.samplingPool()
+        pooled.functions = g.functions
+        def pooledFrame():
+            offset[0] += 5
+            pooled.renderMarkers((-400 + offset[0], -400, 800, 800))
+        results[f"{count} curves"] = {
+                "intersections": len(found["intersections"][0]),
+                "cold ms": milliseconds(cold, 5),
+                "cached ms": milliseconds(lambda: g.getAnalysis(region), 20),
+                "interactive ms": milliseconds(pan, 20),
+                "pooled frame ms": milliseconds(pooledFrame, 20)
+                }
+    return results
+
+def launch(sessionPath, repeat=3):
+    # best time to first frame in ms, as a freshly started viewer reports it, for the session at `sessionPath`
+    environment = {**os.environ, "GRAPHING_SESSION": sessionPath, "GRAPHING_SOCKET": sessionPath + ".sock"}
+    code = "import time\nlaunched = time.perf_counter()\nimport camera\ncamera.main(launched, maxFrames=1)"
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], env=environment, stdin=subprocess.DEVNULL,
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        times.append(float(re.search(r"first frame in (\d+)ms", output)[1]))
+    return min(times)
+
+@benchmark
+def startup():
+    # time to first frame of a restarted viewer: with the default curve, and with a saved session of many curves,
+    # both before its compiled store exists and once it does
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "session.json")
+        results["default curve"] = {"ms": launch(path)}
+        g = grid.grid()
+        addCurves(g, 300)
+        session.saveSession(g, path)
+        store = session.getStorePath(path)
+        def uncompiled():
+            if os.path.exists(store):
+                os.remove(store)
+            return launch(path, 1)
+        results["300 curves parsed"] = {"ms": min(uncompiled() for _ in range(3))}
+        launch(path, 1) # writes the store
+        results["300 curves stored"] = {"ms": launch(path)}
+    return results
+
+def generateExpression(terms):
+    # machine-generated style: a long sum of scaled powers
+    return " + ".join(f"{(index % 9) + 1}.5x^{index % 4} - (x + {index})/{index + 1}" for index in range(terms))
+
+@benchmark
+def parsing():
+    # tokenize + convert; time per character should stay flat as expressions grow. then optimizing and compiling
+    # both backends, which must cope with machine-generated lengths too
+    results = {}
+    for terms in (1, 10, 100, 1000):
+        string = generateExpression(terms)
+        parses = rate(lambda: postfix.infixToPostfix(postfix.strToInfix(string)), max(1, 1000 // terms))
+        expression = postfix.infixToPostfix(postfix.strToInfix(string))
+        compiles = rate(lambda: postfix.compileExpression(expression), max(1, 100 // terms), repeat=3)
+        results[f"{terms} terms"] = {"characters": len(string), "parses/s": parses, "characters/s": parses * len(string),
+                "compiles/s": compiles}
+    return results
+
+@benchmark
+def expressionCache():
+    # rebuilding the same set of functions, as dashboards do, with and without the compiled-expression cache
+    strings = evaluationExpressions + [generateExpression(10)]
+    def rebuild():
+        g = grid.grid()
+        for string in strings:
+            g.addFuncFromString(string)
+    def cold():
+        postfix.cache.clear()
+        rebuild()
+    postfix.cache.clear()
+    before = rate(cold, 20)
+    after = rate(rebuild, 20)
+    return {"rebuild": {"cold/s": before, "cached/s": after, "speedup": after / before, **postfix.cache.stats()}}
+
+optimizationExpressions = evaluationExpressions + [
+    "(x+1)*(x+1) + (x+1)^2 * 1 + 0",
+    "((2x)^2 - (2x)^2/2)^1 / 1",
+    "-(-(x^2 + 3/x))",
+]
+
+@benchmark
+def optimization():
+    # the optimizing pass must not change results; compare operations per evaluation and the resulting rates
+    xs = numpy.linspace(-50, 50, 2001)
+    results = {}
+    for string in optimizationExpressions:
+        expression = postfix.infixToPostfix(postfix.strToInfix(string))
+        literal = postfix.compilePostfix(expression, optimize=False)
+        optimized = postfix.compilePostfix(expression)
+        literalArray = postfix.compilePostfixArray(expression, optimize=False)
+        optimizedArray = postfix.compilePostfixArray(expression)
+        reference = literalArray(xs)
+        if not numpy.allclose(optimizedArray(xs), reference, rtol=1e-12, equal_nan=True):
+            raise AssertionError(f"optimized array evaluation of `{string}` changed its results")
+        finite = xs[numpy.isfinite(reference)]
+        if not numpy.allclose([optimized(x) for x in finite], [literal(x) for x in finite], rtol=1e-12):
+            raise AssertionError(f"optimized evaluation of `{string}` changed its results")
+        before = rate(lambda: [literal(x) for x in finite], 10) * len(finite)
+        after = rate(lambda: [optimized(x) for x in finite], 10) * len(finite)
+        arrayBefore = rate(lambda: literalArray(xs), 200) * len(xs)
+        arrayAfter = rate(lambda: optimizedArray(xs), 200) * len(xs)
+        results[string] = {
+                "operations": sum(isinstance(item, postfix.operator) for item in expression),
+                "optimized": postfix.countOperations(postfix.optimizePostfix(expression)),
+                "speedup": after / before,
+                "array speedup": arrayAfter / arrayBefore
+                }
+    return results
+
+# upper limits, checked on every run: benchmark: {case: {metric: limit}}, where "*" matches every case.
+# frames must fit a 30Hz budget even when everything is redrawn, and a 60Hz one otherwise; so must analysis.
+budgets = {
+    "frames": {
+        "*": {"ms": 1000 / 60},
+        "grid zoom": {"ms": 1000 / 30},
+        "tiles zoom": {"ms": 1000 / 30}
+        },
+    "gridlines": {
+        "*": {"frame ms": 1000 / 60}
+        },
+    "dataSeries": {
+        "*": {"frame ms": 1000 / 60}
+        },
+    "analysis": {
+        "*": {"cold ms": 1000 / 30, "cached ms": 1000 / 60, "interactive ms": 1000 / 60, "pooled frame ms": 1000 / 60}
+        }
+}
+
+def getDirection(metric):
+    # 1 when bigger is better, -1 when smaller is, 0 for figures that only describe the case
+    if metric.endswith("/s") or metric.endswith("speedup"):
+        return 1
+    if metric.endswith("ms") or metric.endswith("px"):
+        return -1
+    return 0
+
+def getEnvironment():
+    return {
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "pygame": pygame.version.ver,
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "cpus": os.cpu_count()
+            }
+
+def checkBudgets(results):
+    # (benchmark, case, metric, value, limit) for every figure over its budget
+    failures = []
+    for name, cases in results.items():
+        for case, values in cases.items():
+            limits = {**budgets.get(name, {}).get("*", {}), **budgets.get(name, {}).get(case, {})}
+            for metric, limit in limits.items():
+                if metric in values and values[metric] > limit:
+                    failures.append((name, case, metric, values[metric], limit))
+    return failures
+
+def compare(results, baseline, tolerance):
+    # (benchmark, case, metric, value, baseline value, change) for every figure that got worse by more than `tolerance`
+    regressions = []
+    for name, cases in results.items():
+        for case, values in cases.items():
+            for metric, value in values.items():
+                old = baseline.get(name, {}).get(case, {}).get(metric)
+                direction = getDirection(metric)
+                if old is None or not direction or not old:
+                    continue
+                change = (value - old) / old
+                if change * direction < -tolerance:
+                    regressions.append((name, case, metric, value, old, change))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="headless benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, out of {', '.join(benchmarks)}; all by default")
+    parser.add_argument("--json", help="write the results and the environment they were measured in to this file")
+    parser.add_argument("--baseline", help="results file from an earlier --json run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+            help="fraction a figure may get worse than the baseline before it counts as a regression")
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in benchmarks:
+            parser.error(f"unknown benchmark {name}")
+
+    results = {}
+    for name in args.names or benchmarks:
+        print(f"{name}:")
+        results[name] = benchmarks[name]()
+        for case, values in results[name].items():
+            print(f"  {case}: " + ", ".join(f"{key}={value:,.1f}" for key, value in values.items()))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"environment": getEnvironment(), "results": results}, file, indent=4)
+
+    failed = False
+    for name, case, metric, value, limit in checkBudgets(results):
+        print(f"over budget: {name} / {case}: {metric}={value:,.1f}, limit {limit:,.1f}")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["environment"] != getEnvironment():
+            print("note: the baseline was measured in a different environment")
+        for name, case, metric, value, old, change in compare(results, baseline["results"], args.tolerance):
+            print(f"regression: {name} / {case}: {metric}={value:,.1f}, was {old:,.1f} ({change:+.0%})")
+            failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
 import grid
+import tiles
+import profiling
+import session
 import pygame
+import os
 import math
 import time
-import threading
+import tempfile
 from dataclasses import dataclass, field
 
 def normalizeRatio(ratio):
@@ -23,6 +27,7 @@ class Camera:
         self.panning = False
         self.panStart = [0, 0]
         self.panCurrent = [0, 0]
+        self.lastInteraction = 0 # time of the last pan or zoom input
         self.screen = screen
     def getPanDifference(self):
         scale = self.getScaleDifference()
@@ -42,14 +47,31 @@ class Camera:
     def setMagnitudeByScale(self, scale):
         currentScale = self.getScaleDifference()[0]
         self.zoomMagnitude *= (scale / currentScale)
-    def render(self):
+    def getViewport(self):
+        # (left, top, width, height) in world units; not a Rect, so deep zooms still pan smoothly
         width, height = self.getSize()
-        viewport = pygame.Rect((0, 0, width, height))
-        viewport.center = self.position
+        x, y = self.position
         if self.panning:
             panDifference = self.getPanDifference()
-            viewport.center = (viewport.center[0] + panDifference[0], viewport.center[1] + panDifference[1])
-        return self.renderable.render(viewport)
+            x, y = x + panDifference[0], y + panDifference[1]
+        return (x - width / 2, y - height / 2, width, height)
+    def interact(self):
+        self.lastInteraction = time.monotonic()
+    def getSettleDelay(self):
+        # seconds until input counts as settled and a full detail frame is due; None once settled
+        if self.panning:
+            return None
+        settleTime = getattr(self.renderable.settings, "interactiveSettleTime", 0)
+        remaining = self.lastInteraction + settleTime - time.monotonic()
+        return remaining if remaining > 0 else None
+    def isInteracting(self):
+        return self.panning or self.getSettleDelay() is not None
+    def getRenderState(self):
+        # equal between two frames only if they would render identically
+        return self.getViewport(), self.screen.get_size(), self.isInteracting(), self.renderable.getRevision()
+    def render(self):
+        # drawn at the screen's resolution, whatever the zoom
+        return self.renderable.render(self.getViewport(), self.screen.get_size(), self.isInteracting())
     def zoomTo(self, amount):
         difference = self.zoomMagnitude - amount
         self.zoom(1, difference)
@@ -64,6 +86,7 @@ class UI:
     def __init__(self, camera, intervalMap):
         self.camera = camera
         self.intervalMap = intervalMap
+        self.showProfile = False # F3 toggles the frame-time overlay
 
     def dispatchEvents(self, events):
         running = True
@@ -75,14 +98,23 @@ class UI:
                     self.camera.panCurrent = event.pos
                 elif event.button == 4:
                     self.camera.zoomIn(20)
+                    self.camera.interact()
                 elif event.button == 5:
                     self.camera.zoomOut(20)
+                    self.camera.interact()
             elif event.type == pygame.MOUSEMOTION:
                 self.camera.panCurrent = event.pos
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:
                     self.camera.panning = False
                     self.camera.lockPan()
+                    self.camera.interact()
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F3:
+                    self.showProfile = not self.showProfile
+                elif event.key == pygame.K_F4:
+                    settings = self.camera.renderable.settings
+                    settings.showAnalysis = not settings.showAnalysis
             elif event.type == pygame.QUIT:
                 running = False
                 break
@@ -96,14 +128,43 @@ class UI:
                     setattr(grid.settings, itemName, value)
 
 
-def main():
+def wake():
+    # from worker threads when new samples land; the window may already be closing
+    try:
+        pygame.event.post(pygame.event.Event(pygame.USEREVENT))
+    except pygame.error:
+        pass
+
+def startChannel(g):
+    # equations and curve commands from stdin and GRAPHING_SOCKET; see commands.py. started after the first frame,
+    # since asyncio is slow to import and nothing can arrive before there is a view anyway
+    import commands
+    socketPath = os.environ.get("GRAPHING_SOCKET", os.path.join(tempfile.gettempdir(), "graphing.sock"))
+    channel = commands.commandChannel(socketPath)
+    try:
+        channel.start()
+    except OSError as error:
+        print(f"not listening on {socketPath}: {error}")
+        channel = commands.commandChannel()
+        channel.start()
+    # curves from the session can be updated and removed by name, like the ones added by command
+    with channel.lock:
+        channel.curves.update((f.name, f) for f in g.functions if f.kind == "function")
+    return channel
+
+def main(launched=None, maxFrames=None):
+    # `launched` is when the process started, for the time to first frame; `maxFrames` quits after that many frames
+    launched = launched or time.perf_counter()
     screenRatio = (800, 800)
-    pygame.init()
-    pygame.font.init()
+    pygame.display.init() # not pygame.init(): audio and the rest are never used, and cost startup time
     screen = pygame.display.set_mode(screenRatio)
 
+    # GRAPHING_PROFILE names a file the stage timings are written to every few seconds
+    profile = profiling.profiler(dumpPath=os.environ.get("GRAPHING_PROFILE"))
     g = grid.grid()
-    c = Camera(0, 0, 800, 0.1, 100, g, screenRatio, screen)
+    g.profiler = profile
+    g.pool = grid.samplingPool(onReady=wake)
+    c = Camera(0, 0, 800, 0.1, 100, tiles.tileCache(g), screenRatio, screen)
     u = UI(c, {
             (0, 0.5): {
                 "gridDivision": (16, 1),
@@ -142,25 +203,53 @@ def main():
     g.addFuncFromString("(1/100)x ^ 2", (255, 0, 0), grid.linetype.squiggly, 4)
     g.addFuncFromString("2x + 10", (255, 0, 255), grid.linetype.dotted, 6)
     """
-    g.addFuncFromString("(1/9x)^2", (0, 0, 255), grid.linetype.solid, 2)
-    surface = c.render()
+    # GRAPHING_SESSION is where the curves are kept between runs, with their compiled forms alongside
+    sessionPath = os.environ.get("GRAPHING_SESSION", os.path.join(os.path.expanduser("~"), ".graphing", "session.json"))
+    with profile.time("session load"):
+        if not session.loadSession(g, sessionPath):
+            g.addFuncFromString("(1/9x)^2", (0, 0, 255), grid.linetype.solid, 2)
     running = True
-    inputBuffer = {"text": None}
-    def getInput():
-        while True:
-            inputBuffer["text"] = input("input a new equation: ")
-    getInputThread = threading.Thread(target=getInput)
-    #getInputThread.start()
-    while running:
-        if inputBuffer["text"] is not None:
-            g.addFuncFromString(inputBuffer["text"], lineWidth=5)
-            inputBuffer["text"] = None
-        surface = c.render()
-        surface = pygame.transform.scale(surface, screen.get_rect().size)
-        screen.blit(surface, (0, 0))
-        pygame.display.flip()
-        running = u.dispatchEvents(pygame.event.get())
-        u.setGridByZoom(g)
+    channel = None
+    frames = 0
+    renderedState = None
+    while running and (maxFrames is None or frames < maxFrames):
+        if channel is not None:
+            with profile.time("commands"):
+                channel.apply(g)
+            profile.counters["commands applied"] = channel.applied
+        state = c.getRenderState(), u.showProfile
+        if state != renderedState:
+            with profile.time("frame"):
+                with profile.time("render"):
+                    surface = c.render()
+                with profile.time("blit"):
+                    screen.blit(surface, (0, 0))
+                if u.showProfile:
+                    with profile.time("overlay"):
+                        profile.drawOverlay(screen)
+                pygame.display.flip()
+            if not frames:
+                firstFrame = (time.perf_counter() - launched) * 1000
+                profile.counters["time to first frame ms"] = round(firstFrame, 1)
+                print(f"first frame in {firstFrame:.0f}ms")
+            frames += 1
+            profile.counters["evaluations"] = g.getEvaluations()
+            renderedState = state
+            events = pygame.event.get()
+        else:
+            # nothing changed; sleep until something happens or the view settles and needs full detail
+            settleDelay = c.getSettleDelay()
+            timeout = 0 if settleDelay is None else max(int(settleDelay * 1000), 1)
+            events = [pygame.event.wait(timeout)] + pygame.event.get()
+        with profile.time("events"):
+            running = u.dispatchEvents(events)
+            u.setGridByZoom(g)
+        if channel is None:
+            channel = startChannel(g)
+        profile.maybeDump()
+    if channel is not None:
+        channel.stop()
+    session.saveSession(g, sessionPath)
     pygame.quit()
 
 if __name__ == '__main__':
@@ -0,0 +1,264 @@
+import os
+import sys
+import stat
+import errno
+import socket
+import asyncio
+import threading
+import pygame
+import postfix
+import grid
+
+# text commands for a running view, one per line, from stdin and from a local unix socket:
+#     add NAME = EXPRESSION        plot y = EXPRESSION as NAME, replacing any curve already called NAME
+#     update NAME = EXPRESSION     the same; kept separate so scripts read naturally
+#     remove NAME
+#     style NAME [color=R,G,B] [width=N] [type=solid|dotted|squiggly] [visible=0|1]
+#     clear                        remove every curve commands can name, including those restored from a session
+#     EXPRESSION                   plot it under its own text, as typing an equation always did
+# lines are parsed and compiled on the channel's own thread; the render thread applies everything that arrived
+# since the last frame in one go, so a frame never shows half a batch. errors go back to whoever sent the line.
+
+def parseStyle(words):
+    # {setting: value} from `key=value` words
+    style = {}
+    for word in words:
+        key, _, value = word.partition("=")
+        if key == "color":
+            color = tuple(int(part) for part in value.split(","))
+            if len(color) not in (3, 4) or not all(0 <= part <= 255 for part in color):
+                raise ValueError(f"color should be R,G,B with each 0-255; got {value}")
+            style["lineColor"] = color
+        elif key == "width":
+            style["lineWidth"] = int(value)
+        elif key == "type":
+            if not hasattr(grid.linetype, value):
+                raise ValueError(f"type should be solid, dotted or squiggly; got {value}")
+            style["lineType"] = getattr(grid.linetype, value)
+        elif key == "visible":
+            style["visible"] = value not in ("0", "false", "no")
+        else:
+            raise ValueError(f"unknown style `{key}`; expected color, width, type or visible")
+    return style
+
+def compileCurve(string):
+    # the compiled expression for y = `string`, which may use at most one variable
+    compiled = postfix.getExpression(string)
+    names = list(postfix.classifyVars(compiled.postfix))
+    if len(names) > 1:
+        raise ValueError(f"`{string}` should have at most one variable; got {', '.join(names)}")
+    return compiled
+
+def claimSocket(path):
+    # removes a socket left behind by a view that did not shut down cleanly; raises OSError if a view is still
+    # listening on it, rather than taking it over
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, f"another view is listening on {path}; set GRAPHING_SOCKET to use another path")
+
+def parseCommand(line):
+    # (action, name, payload) for one line, or None for a blank line or comment.
+    # all the expensive work happens here, so applying a command is just swapping references
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    action, _, rest = line.partition(" ")
+    if action in ("add", "update"):
+        name, equals, expression = rest.partition("=")
+        name = name.strip()
+        if not equals or not name:
+            raise ValueError(f"expected `{action} NAME = EXPRESSION`; got `{line}`")
+        return "set", name, compileCurve(expression.strip())
+    if action == "remove":
+        if not rest.strip():
+            raise ValueError("expected `remove NAME`")
+        return "remove", rest.strip(), None
+    if action == "style":
+        if not rest.strip():
+            raise ValueError("expected `style NAME key=value ...`")
+        name, *words = rest.split()
+        return "style", name, parseStyle(words)
+    if action == "clear":
+        return "clear", None, None
+    try:
+        return "set", line, compileCurve(line)
+    except ValueError as error:
+        if rest and action.isidentifier():
+            # a word and more that do not make a curve: most likely a mistyped command
+            raise ValueError(f"unknown command `{action}`; expected add, update, remove, style or clear, "
+                    "or an expression") from error
+        raise
+
+def trackNames(names, command):
+    # the curve names there are once `command` has been applied
+    action, name, _ = command
+    if action == "set":
+        names.add(name)
+    elif action == "remove":
+        names.discard(name)
+    elif action == "clear":
+        names.clear()
+
+class commandChannel:
+    # reads commands on a background asyncio loop and queues them for `apply`, called once per frame by the owner
+    def __init__(self, socketPath=None, stdin=True):
+        self.socketPath = socketPath
+        self.stdin = stdin
+        self.lock = threading.Lock()
+        self.pending = []
+        self.curves = {} # name: function that commands can refer to
+        self.applied = 0 # commands applied so far
+        self.loop = None
+        self.thread = None
+        self.pipe = False # whether stdin is read through a non-blocking pipe
+
+    def start(self):
+        # returns once the socket is listening; raises OSError if it cannot be
+        self.loop = asyncio.new_event_loop()
+        self.error = None
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait()
+        if self.error is not None:
+            self.thread.join()
+            raise self.error
+
+    def stop(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.stopping.set)
+            self.thread.join()
+        if self.pipe:
+            os.set_blocking(sys.stdin.fileno(), True) # the read pipe leaves it non-blocking, and a terminal shares it
+
+    def run(self, started):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serveAll(started))
+        finally:
+            self.loop.close()
+
+    async def serveAll(self, started):
+        self.stopping = asyncio.Event()
+        server = None
+        try:
+            if self.socketPath is not None:
+                claimSocket(self.socketPath)
+                server = await asyncio.start_unix_server(self.serve, self.socketPath)
+                owned = os.stat(self.socketPath).st_ino
+        except OSError as error:
+            self.error = error
+            return
+        finally:
+            started.set()
+        if self.stdin and sys.stdin is not None:
+            self.loop.create_task(self.readStdin())
+        await self.stopping.wait()
+        if server is not None:
+            server.close()
+            try:
+                if os.stat(self.socketPath).st_ino == owned:
+                    os.unlink(self.socketPath) # unless something else has replaced it since
+            except FileNotFoundError:
+                pass
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def readStdin(self):
+        reader = asyncio.StreamReader()
+        try:
+            mode = os.fstat(sys.stdin.fileno()).st_mode
+            if not (stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or sys.stdin.isatty()):
+                raise ValueError("stdin cannot be polled")
+            await self.loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        except (ValueError, OSError):
+            # stdin is a regular file, /dev/null or was closed; read it through a thread instead
+            while line := await self.loop.run_in_executor(None, sys.stdin.readline):
+                self.receive([line], lambda message: print(message, file=sys.stderr))
+            return
+        self.pipe = True
+        await self.read(reader, lambda message: print(message, file=sys.stderr))
+
+    async def serve(self, reader, writer):
+        def reply(message):
+            writer.write(message.encode() + b"\n")
+        try:
+            await self.read(reader, reply)
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass # the client went away, or the view is closing
+        finally:
+            writer.close()
+
+    async def read(self, reader, reply):
+        # whatever arrived in one read is handled as one batch, so a burst of lines wakes the view once
+        rest = b""
+        while data := await reader.read(1 << 16):
+            *lines, rest = (rest + data).split(b"\n")
+            self.receive([line.decode(errors="replace") for line in lines], reply)
+        self.receive([rest.decode(errors="replace")], reply)
+
+    def getNames(self):
+        # the curve names commands can refer to once everything queued has been applied
+        with self.lock:
+            names = set(self.curves)
+            for command in self.pending:
+                trackNames(names, command)
+        return names
+
+    def receive(self, lines, reply):
+        commands = []
+        names = self.getNames()
+        for line in lines:
+            try:
+                command = parseCommand(line)
+                if command is not None and command[0] in ("remove", "style") and command[1] not in names:
+                    raise ValueError(f"no curve named `{command[1]}`")
+            except Exception as error:
+                # anything one line does wrong is its sender's problem; the rest of the batch still goes through
+                reply(f"error: {error}")
+                continue
+            if command is not None:
+                trackNames(names, command)
+                commands.append(command)
+        if commands:
+            with self.lock:
+                wake = not self.pending
+                self.pending.extend(commands)
+            if wake:
+                pygame.event.post(pygame.event.Event(pygame.USEREVENT)) # wake the main loop
+
+    def apply(self, g):
+        # applies every queued command to `g`; returns how many there were. the names were checked as the lines
+        # came in, against the curves as they are here, so the lock is held until the curves match the queue again
+        with self.lock:
+            commands, self.pending = self.pending, []
+            for action, name, payload in commands:
+                curve = self.curves.get(name)
+                if action == "set":
+                    if curve is None:
+                        curve = self.curves[name] = grid.function(payload.postfix, compiled=payload, name=name)
+                        g.addFunc(curve)
+                    else:
+                        curve.setExpression(payload.postfix, payload)
+                elif action == "remove" and curve is not None:
+                    g.removeFunc(self.curves.pop(name))
+                elif action == "style" and curve is not None:
+                    for setting, value in payload.items():
+                        setattr(curve.settings, setting, value)
+                elif action == "clear":
+                    for curve in self.curves.values():
+                        g.removeFunc(curve)
+                    self.curves.clear()
+        self.applied += len(commands)
+        return len(commands)
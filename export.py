@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import postfix
+import grid
+
+# batch export without a window. each line of the plot file is one plot:
+#     expression[; expression ...] [@ left, top, width, height]
+# blank lines and lines starting with # are skipped; the viewport defaults to the one camera.main starts with.
+
+defaultViewport = (-400, -400, 800, 800)
+palette = [(0, 0, 255), (255, 0, 0), (0, 160, 0), (255, 0, 255), (0, 160, 160), (160, 96, 0)]
+
+def parsePlots(lines):
+    # (line number, expressions, viewport) for every plot in the file
+    plots = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        expressions, _, viewport = line.partition("@")
+        expressions = [expression.strip() for expression in expressions.split(";") if expression.strip()]
+        try:
+            viewport = tuple(float(value) for value in viewport.split(",")) if viewport.strip() else defaultViewport
+        except ValueError:
+            raise ValueError(f"line {number}: viewport should be `left, top, width, height`; got {viewport.strip()}")
+        if len(viewport) != 4 or viewport[2] <= 0 or viewport[3] <= 0:
+            raise ValueError(f"line {number}: viewport should be `left, top, width, height`; got {viewport}")
+        plots.append((number, expressions, viewport))
+    return plots
+
+def parseSize(string):
+    width, _, height = string.partition("x")
+    return int(width), int(height or width)
+
+def toSvg(g, region, samples):
+    # gridlines and sampled curves as vector paths, broken and clipped as they are on screen
+    width, height = region.size
+    color = "rgb(%d, %d, %d)"
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
+            f'<rect width="{width}" height="{height}" fill="{color % g.settings.gridColor[:3]}"/>']
+    lines = []
+    for grade, lineweight in g.getGridlines(region.left, region.right, region.scaleX):
+        x = region.toScreenX(grade)
+        lines.append(f'<line x1="{x:.2f}" y1="0" x2="{x:.2f}" y2="{height}" stroke-width="{g.toPixels(region, lineweight)}"/>')
+    for grade, lineweight in g.getGridlines(region.top, region.bottom, region.scaleY):
+        y = region.toScreenY(grade)
+        lines.append(f'<line x1="0" y1="{y:.2f}" x2="{width}" y2="{y:.2f}" stroke-width="{g.toPixels(region, lineweight)}"/>')
+    parts.append(f'<g stroke="{color % g.settings.lineColor[:3]}">' + "".join(lines) + "</g>")
+    for function, xs, ys in samples:
+        commands = []
+        for polylineXs, polylineYs in g.getPolylines(region, region.toScreenX(xs), region.toScreenY(ys), 2):
+            commands.extend(f"{'L' if index else 'M'}{x:.2f} {y:.2f}"
+                    for index, (x, y) in enumerate(zip(polylineXs.tolist(), polylineYs.tolist())))
+        settings = function.settings
+        parts.append(f'<path d="{" ".join(commands)}" fill="none" stroke="{color % settings.lineColor[:3]}" '
+                f'stroke-width="{g.toPixels(region, settings.lineWidth)}" stroke-linejoin="round"/>')
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+class exporter:
+    # renders plots one after another through a single grid, so layers and compiled expressions carry over
+    def __init__(self, size, outDir, png=True, svg=False):
+        self.size = size
+        self.outDir = outDir
+        self.png = png
+        self.svg = svg
+        self.grid = grid.grid()
+        # an image has no zoom level to tune the settings for, so sizes stay in pixels whatever the viewport
+        self.grid.settings.pixelSizes = True
+
+    def export(self, plot):
+        # (line number, written paths, error message or None)
+        number, expressions, viewport = plot
+        g = self.grid
+        try:
+            for index, expression in enumerate(expressions):
+                names = list(postfix.classifyVars(postfix.getExpression(expression).postfix))
+                if len(names) > 1:
+                    raise ValueError(f"`{expression}` should have at most one variable; got {', '.join(names)}")
+                g.addFuncFromString(expression, palette[index % len(palette)])
+            name = os.path.join(self.outDir, f"plot{number:05d}")
+            written = []
+            if self.png:
+                pygame.image.save(g.render(viewport, self.size), name + ".png")
+                written.append(name + ".png")
+            if self.svg:
+                region = grid.projection(viewport, self.size)
+                with open(name + ".svg", "w") as file:
+                    file.write(toSvg(g, region, g.sampleFunctions(region)))
+                written.append(name + ".svg")
+            return number, written, None
+        except Exception as error:
+            # one bad plot, however it fails, is reported and the rest of the batch carries on
+            return number, [], str(error) or type(error).__name__
+        finally:
+            for function in list(g.functions):
+                g.removeFunc(function)
+
+worker = None # this process's exporter, set up once per pool process
+
+def startWorker(*args):
+    global worker
+    worker = exporter(*args)
+
+def exportPlot(plot):
+    return worker.export(plot)
+
+def exportAll(plots, size, outDir, png=True, svg=False, workers=1):
+    # yields (line number, written paths, error) as plots finish, in no particular order when parallel
+    os.makedirs(outDir, exist_ok=True)
+    args = (size, outDir, png, svg)
+    if workers <= 1:
+        startWorker(*args)
+        yield from map(exportPlot, plots)
+        return
+    chunksize = max(1, min(32, len(plots) // (workers * 4)))
+    with multiprocessing.Pool(workers, initializer=startWorker, initargs=args) as pool:
+        yield from pool.imap_unordered(exportPlot, plots, chunksize)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="render plots to image files without a window")
+    parser.add_argument("plots", help="file of plots, one per line: expression[; expression ...] [@ left, top, width, height]")
+    parser.add_argument("-o", "--out", default="plots", help="output directory")
+    parser.add_argument("-s", "--size", type=parseSize, default=(800, 800), help="image size in pixels, WIDTHxHEIGHT")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="processes to render with")
+    parser.add_argument("--svg", action="store_true", help="also write vector paths of the sampled curves")
+    parser.add_argument("--no-png", dest="png", action="store_false", help="skip the raster images")
+    args = parser.parse_args(argv)
+    with open(args.plots) as file:
+        try:
+            plots = parsePlots(file)
+        except ValueError as error:
+            parser.error(str(error))
+    begin = time.perf_counter()
+    failed = 0
+    for number, written, error in exportAll(plots, args.size, args.out, args.png, args.svg, args.workers):
+        if error is not None:
+            failed += 1
+            print(f"line {number}: {error}", file=sys.stderr)
+    elapsed = time.perf_counter() - begin
+    done = len(plots) - failed
+    print(f"{done} plots in {elapsed:.2f}s, {done / elapsed if elapsed else 0:,.1f} plots/s"
+            + (f", {failed} failed" if failed else ""))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,40 @@
 import pygame
+import numpy
+import copy
+import dataclasses
 from dataclasses import dataclass
 from typing import Callable
 import postfix
+import labels
+import profiling
+import analysis
 import time
 import math
+import os
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-def signof(x):
-    return (x >= 0) * 2 - 1
-
-start = next
+# revisions of every curve come from this one counter, so a new curve or expression never repeats the revision of
+# one that was removed, and cache keys made of revisions cannot mix them up
+revisions = itertools.count(1)
 
 class linetype:
     solid = 0
     dotted = 1
     squiggly = 2
 
+class tracked:
+    # bumps `revision` whenever an attribute is set to a different value, so renderers can tell when to redraw.
+    revision = 0
+    def __setattr__(self, name, value):
+        if name != "revision" and (name not in self.__dict__ or self.__dict__[name] != value):
+            super().__setattr__("revision", self.revision + 1)
+        super().__setattr__(name, value)
+
 @dataclass
-class gridSettings:
+class gridSettings(tracked):
     labelXInterval: int = 128 # negative for no label
     labelYInterval: int = 128
     gridDivision: tuple = (128, 2) # (Main frequency, subdivision)
@@ -26,78 +44,537 @@ class gridSettings:
     lineWeightMajor: int = 3 # line weight for major gridlines
     lineWeightMinor: int = 2 # line weight for subdividing gridlines
     labelScale: int = 15
-    maxFunctionSegments: int = 1000
+    minGridSpacing: int = 8 # pixels; denser gridlines are thinned out by powers of two
+    minLabelSpacing: int = 48 # pixels; likewise for labels
+    pixelSizes: bool = False # weights, widths and label sizes in pixels, and spacing fitted to the image, as for export
+    functionSegments: int = 100 # evenly spaced samples before adaptive refinement
+    implicitCellSize: int = 2 # pixels per evaluated cell of an implicit plot
+    sampleTolerance: float = 0.5 # max distance in pixels between a curve and its drawn chord
+    maxFunctionEvaluations: int = 4000 # refinement budget per function per frame
+    interactiveSettleTime: float = 0.15 # seconds without input before a frame is refined to full detail
+    interactiveSampleScale: int = 4 # while interacting: this many times fewer samples and looser tolerance
+    interactiveMinorGridlines: bool = False
+    interactiveLabels: bool = False
+    showAnalysis: bool = False # mark zeros, extrema and intersections of y = f(x) curves
+    analysisMarkerRadius: int = 4
 
 @dataclass
-class funcSettings:
+class funcSettings(tracked):
     lineType: int = linetype.solid
     lineColor: tuple = (0, 0, 0)
     lineWidth: int = 2
     visible: bool = True
 
-NINETYDEG = math.pi/2
+def refineSamples(callArray, xs, ys, tolerance, budget, band, minWidth=0.125):
+    # split intervals level by level wherever the midpoint strays from the chord by more than `tolerance`.
+    # every level is a single batched evaluation; the widest deviations are refined first once the budget runs short.
+    # intervals lying wholly above or below `band` are never drawn, so they are left alone.
+    # inf - inf and the like are expected here and mean the same as nan
+    with numpy.errstate(all="ignore"):
+        allXs, allYs = [xs], [ys]
+        left, right, yLeft, yRight = xs[:-1], xs[1:], ys[:-1], ys[1:]
+        evaluations = 0
+        while len(left) and evaluations < budget:
+            wide = right - left > minWidth
+            left, right, yLeft, yRight = left[wide], right[wide], yLeft[wide], yRight[wide]
+            if len(left) > budget - evaluations:
+                spread = numpy.nan_to_num(numpy.abs(yRight - yLeft), nan=numpy.inf)
+                worst = numpy.sort(numpy.argsort(-spread, kind="stable")[:budget - evaluations])
+                left, right, yLeft, yRight = left[worst], right[worst], yLeft[worst], yRight[worst]
+            middle = (left + right) / 2
+            yMiddle = callArray(middle)
+            evaluations += len(middle)
+            allXs.append(middle)
+            allYs.append(yMiddle)
+            # nan compares false, so anything non-finite keeps splitting unless the whole interval is undefined
+            bent = ~(numpy.abs(yMiddle - (yLeft + yRight) / 2) <= tolerance)
+            bent &= ~(numpy.isnan(yLeft) & numpy.isnan(yMiddle) & numpy.isnan(yRight))
+            bent &= ~((yLeft < band[0]) & (yMiddle < band[0]) & (yRight < band[0]))
+            bent &= ~((yLeft > band[1]) & (yMiddle > band[1]) & (yRight > band[1]))
+            left, right = numpy.concatenate((left[bent], middle[bent])), numpy.concatenate((middle[bent], right[bent]))
+            yLeft, yRight = numpy.concatenate((yLeft[bent], yMiddle[bent])), numpy.concatenate((yMiddle[bent], yRight[bent]))
+        xs = numpy.concatenate(allXs)
+        order = numpy.argsort(xs, kind="stable")
+        return xs[order], numpy.concatenate(allYs)[order], evaluations
+
+def splitBreaks(callArray, xs, ys, tolerance, band, minWidth, iterations=40):
+    # poles and jumps between neighbouring samples become nan separators, so no line is drawn across them.
+    # a steep interval is a break when samples inside it do not run monotonically from one end to the other,
+    # as they do for a continuous curve refined to the tolerance. each break is then bisected toward the jump
+    # until both sides are off screen, so the curve still runs to the edge, and dropped if the jump closes up.
+    # as in refineSamples, steps between infinite samples are nan and handled as such
+    with numpy.errstate(all="ignore"):
+        height = (band[1] - band[0]) / 3
+        visible = band[0] + height, band[1] - height
+        yLeft, yRight = ys[:-1], ys[1:]
+        steep = numpy.abs(yRight - yLeft) > height / 2
+        steep &= ~(((yLeft < band[0]) & (yRight < band[0])) | ((yLeft > band[1]) & (yRight > band[1])))
+        candidates = numpy.flatnonzero(steep)
+        if not len(candidates):
+            return xs, ys, 0
+        a, b = xs[candidates], xs[candidates + 1]
+        inner = a[:, None] + (b - a)[:, None] * numpy.array([0.25, 0.5, 0.75])
+        yInner = callArray(inner)
+        evaluations = inner.size
+        points = numpy.column_stack((a, inner, b))
+        values = numpy.column_stack((yLeft[candidates], yInner, yRight[candidates]))
+        steps = numpy.diff(values, axis=1)
+        direction = numpy.sign(values[:, -1] - values[:, 0])[:, None]
+        broken = ~numpy.all(steps * direction >= -tolerance, axis=1)
+        allXs, allYs = [xs, inner[broken].ravel()], [ys, yInner[broken].ravel()]
+
+        # bracket each break by its widest quarter, then bisect
+        rows = numpy.flatnonzero(broken)
+        widest = numpy.argmax(numpy.nan_to_num(numpy.abs(steps[rows]), nan=numpy.inf), axis=1)
+        a, b = points[rows, widest], points[rows, widest + 1]
+        ya, yb = values[rows, widest], values[rows, widest + 1]
+        def offScreen(y):
+            return ~((visible[0] <= y) & (y <= visible[1]))
+        for _ in range(iterations):
+            active = ~(offScreen(ya) & offScreen(yb)) & (b - a > minWidth * 1e-9)
+            if not active.any():
+                break
+            middle = (a[active] + b[active]) / 2
+            yMiddle = callArray(middle)
+            evaluations += len(middle)
+            allXs.append(middle)
+            allYs.append(yMiddle)
+            # the jump is in whichever half changes more
+            left = numpy.nan_to_num(numpy.abs(yMiddle - ya[active]), nan=numpy.inf)
+            right = numpy.nan_to_num(numpy.abs(yb[active] - yMiddle), nan=numpy.inf)
+            toLeft = left >= right
+            a[active], ya[active] = numpy.where(toLeft, a[active], middle), numpy.where(toLeft, ya[active], yMiddle)
+            b[active], yb[active] = numpy.where(toLeft, middle, b[active]), numpy.where(toLeft, yMiddle, yb[active])
+        jumps = ~(numpy.abs(yb - ya) <= tolerance)
+        allXs.append((a[jumps] + b[jumps]) / 2)
+        allYs.append(numpy.full(numpy.count_nonzero(jumps), numpy.nan))
+        xs = numpy.concatenate(allXs)
+        order = numpy.argsort(xs, kind="stable")
+        return xs[order], numpy.concatenate(allYs)[order], evaluations
+
+def clipSegments(x0, y0, x1, y1, rect):
+    # liang-barsky for arrays of segments against rect = (left, top, right, bottom).
+    # returns the parameters (t0, t1) of the part inside, and which segments have one
+    left, top, right, bottom = rect
+    dx, dy = x1 - x0, y1 - y0
+    t0, t1 = numpy.zeros(len(x0)), numpy.ones(len(x0))
+    inside = numpy.ones(len(x0), dtype=bool)
+    with numpy.errstate(all="ignore"):
+        for p, q in ((-dx, x0 - left), (dx, right - x0), (-dy, y0 - top), (dy, bottom - y0)):
+            r = q / p
+            inside &= (p != 0) | (q >= 0)
+            t0 = numpy.where(p < 0, numpy.maximum(t0, r), t0)
+            t1 = numpy.where(p > 0, numpy.minimum(t1, r), t1)
+    return t0, t1, inside & (t0 < t1)
+
+class sampleCache:
+    # adaptively sampled (x, y) per (step, tolerance). base samples sit at multiples of the step,
+    # so a pan only samples and refines the newly exposed range. refinement covers a band of y values
+    # three times the visible height, and the entry is resampled once the view leaves that band.
+    maxEntries = 4
+    maxSamples = 1 << 18 # across all entries
+
+    def __init__(self, maxEntries=None, maxSamples=None):
+        self.maxEntries = maxEntries or self.maxEntries
+        self.maxSamples = maxSamples or self.maxSamples
+        self.entries = OrderedDict() # (step, tolerance, callArray): (first index, last index, band, xs, ys)
+        self.hits = 0
+        self.misses = 0 # samples evaluated rather than reused
+        self.lock = threading.Lock() # tiles may be rendered on a background thread
+
+    def clear(self):
+        self.entries.clear()
+
+    def size(self):
+        return sum(len(entry[3]) for entry in self.entries.values())
+
+    def evaluate(self, callArray, step, start, stop, tolerance, budget, band):
+        # samples for base indices start <= k < stop, refined in between
+        xs = numpy.arange(start, stop, dtype=float) * step
+        ys = callArray(xs)
+        xs, ys, refined = refineSamples(callArray, xs, ys, tolerance, budget, band, step / 64)
+        xs, ys, split = splitBreaks(callArray, xs, ys, tolerance, band, step / 64)
+        self.misses += stop - start + refined + split
+        return xs, ys
+
+    def sample(self, callArray, step, start, stop, tolerance, budget, visible):
+        # `visible` is the (low, high) range of y values on screen
+        with self.lock:
+            return self.update(callArray, step, start, stop, tolerance, budget, visible)
+
+    def update(self, callArray, step, start, stop, tolerance, budget, visible):
+        # keyed by the compiled function too, so a snapshot still drawing an older expression keeps to its own samples
+        key = (step, tolerance, callArray)
+        first, last, band, xs, ys = self.entries.pop(key, (start, start, visible, numpy.empty(0), numpy.empty(0)))
+        if stop <= first or start >= last or not band[0] <= visible[0] <= visible[1] <= band[1]:
+            height = visible[1] - visible[0]
+            first, last, band = start, stop, (visible[0] - height, visible[1] + height)
+            xs, ys = self.evaluate(callArray, step, start, stop, tolerance, budget, band)
+        else:
+            self.hits += len(xs)
+            parts = [(xs, ys)]
+            if start < first:
+                # overlap by one base sample so the seam interval is refined too
+                newXs, newYs = self.evaluate(callArray, step, start, first + 1, tolerance, budget, band)
+                parts.insert(0, (newXs[:-1], newYs[:-1]))
+            if stop > last:
+                newXs, newYs = self.evaluate(callArray, step, last - 1, stop, tolerance, budget, band)
+                parts.append((newXs[1:], newYs[1:]))
+            xs = numpy.concatenate([part[0] for part in parts])
+            ys = numpy.concatenate([part[1] for part in parts])
+            first, last = min(first, start), max(last, stop)
+        low = numpy.searchsorted(xs, start * step, side="left")
+        high = numpy.searchsorted(xs, (stop - 1) * step, side="right")
+        if len(xs) > self.maxSamples:
+            # keep only what was asked for
+            first, last, xs, ys = start, stop, xs[low:high], ys[low:high]
+            low, high = 0, len(xs)
+        self.entries[key] = (first, last, band, xs, ys)
+        while len(self.entries) > 1 and (len(self.entries) > self.maxEntries or self.size() > self.maxSamples):
+            self.entries.popitem(last=False)
+        return xs[low:high], ys[low:high]
 
 @dataclass
 class function:
-    def __init__(self, expression, settings=None):
+    kind = "function" # y = f(x)
+    def __init__(self, expression, settings=None, compiled=None, name=None):
+        self.name = name or " ".join(str(getattr(item, "name", item)) for item in expression)
+        self.revision = 0
+        self.cache = sampleCache()
+        self.setExpression(expression, compiled)
+        self.settings = settings or funcSettings()
+
+    def setExpression(self, expression, compiled=None):
+        compiled = compiled or postfix.compileExpression(expression)
         self.expression = expression
-        self.call = postfix.getFunctionFromPostfix(self.expression)
+        self.call = compiled.call
+        self.callArray = compiled.callArray
+        self.cache.clear()
+        self.revision = next(revisions)
+
+    def sample(self, step, start, stop, tolerance, budget, visible):
+        return self.cache.sample(self.callArray, step, start, stop, tolerance, budget, visible)
+
+    def countEvaluations(self):
+        return self.cache.misses
+
+class parametric:
+    # the curve (x(t), y(t)) for t in `tRange`; both coordinates are evaluated for every t in one batched call each
+    kind = "parametric"
+    tRange = (-10, 10)
+    samples = 2000
+    def __init__(self, xExpression, yExpression, tRange=None, samples=None, settings=None, name=None):
+        self.name = name or "parametric"
+        self.revision = 0
+        self.evaluations = 0
+        self.setExpressions(xExpression, yExpression, tRange, samples)
         self.settings = settings or funcSettings()
 
-class lineStyleGenerators:
-    @staticmethod
-    def drawSolid(surface, lineWidth, lineColor, progress):
-        p1 = yield
-        while (p2 := (yield)) != None:
-            pygame.draw.line(surface, lineColor, p1, p2, 1)
-            progress += 1
-            p1 = p2
+    def setExpressions(self, xExpression, yExpression, tRange=None, samples=None):
+        self.expressions = xExpression, yExpression
+        self.callArrays = tuple(postfix.compilePostfixBatch(expression, ("t",)) for expression in self.expressions)
+        self.tRange = tRange or self.tRange
+        self.samples = samples or self.samples
+        self.revision = next(revisions)
 
-    @staticmethod
-    def drawDotted(surface, lineWidth, lineColor, progress):
-        p1 = yield
-        while (p2 := (yield)) != None:
-            if math.sin(progress / 50) > 0:
-                pygame.draw.line(surface, lineColor, p1, p2, lineWidth)
-            progress += 1
-            p1 = p2
+    def sample(self, samples=None):
+        ts = numpy.linspace(*self.tRange, samples or self.samples)
+        xs, ys = (callArray(ts) for callArray in self.callArrays)
+        self.evaluations += 2 * len(ts)
+        return xs, ys
+
+    def countEvaluations(self):
+        return self.evaluations
+
+class implicit:
+    # a heat map of f(x, y) with its zero contour drawn in the line colour, so `x^2 + y^2 - 100` shows a circle.
+    # the field is evaluated for a whole grid of cells in one batched call.
+    kind = "implicit"
+    negativeColor = (0, 96, 255)
+    positiveColor = (255, 64, 0)
+    opacity = 96
+    falloff = 150 # pixels from the contour to most of the full shade
+    def __init__(self, expression, settings=None, name=None):
+        self.name = name or "implicit"
+        self.revision = 0
+        self.evaluations = 0
+        self.setExpression(expression)
+        self.settings = settings or funcSettings()
+
+    def setExpression(self, expression):
+        self.expression = expression
+        self.callArray = postfix.compilePostfixBatch(expression, ("x", "y"))
+        self.revision = next(revisions)
+
+    def evaluate(self, xs, ys):
+        # values at every (x, y) pair, indexed [x, y] like pygame.surfarray
+        self.evaluations += len(xs) * len(ys)
+        return self.callArray(xs[:, None], ys[None, :])
+
+    def getColors(self, values, cell):
+        # rgba per value, for values `cell` pixels apart: shaded by sign, stronger with the distance to the zero contour
+        # (estimated as |f| / |grad f|, so it does not depend on what else is in view), opaque line colour
+        # where the sign changes to a neighbour, and clear where undefined
+        finite = numpy.isfinite(values)
+        slope = numpy.hypot(*numpy.gradient(values, cell)) if min(values.shape) > 1 else numpy.zeros(values.shape)
+        with numpy.errstate(all="ignore"):
+            distance = numpy.nan_to_num(numpy.abs(values) / slope, nan=0)
+        strength = numpy.tanh(distance / self.falloff)[..., None]
+        colors = numpy.where((values < 0)[..., None], self.negativeColor, self.positiveColor)
+        rgba = numpy.empty(values.shape + (4,))
+        rgba[..., :3] = 255 + (colors - 255) * strength
+        rgba[..., 3] = self.opacity
+        positive = values >= 0
+        edge = numpy.zeros(values.shape, dtype=bool)
+        edge[:-1] |= (positive[:-1] != positive[1:]) & finite[:-1] & finite[1:]
+        edge[:, :-1] |= (positive[:, :-1] != positive[:, 1:]) & finite[:, :-1] & finite[:, 1:]
+        rgba[edge, :3] = self.settings.lineColor[:3]
+        rgba[edge, 3] = 255
+        rgba[~finite] = 0
+        return rgba.astype(numpy.uint8)
+
+    def countEvaluations(self):
+        return self.evaluations
+
+class samplingPool:
+    # samples functions on worker threads. the render thread gets the newest finished samples for each function
+    # without waiting, and `onReady` is called from a worker whenever newer samples land.
+    # each function has at most one job in flight, so its sampleCache is only ever touched by one thread.
+    def __init__(self, workers=None, onReady=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self.onReady = onReady
+        self.lock = threading.Lock()
+        self.finished = {} # id(function): (function, request, xs, ys)
+        self.running = {} # id(function): request
+        self.wanted = {} # id(function): request
+        self.failed = {} # id(function): request whose sampling raised, so it is not retried every frame
+        self.versions = {} # id(function): count of finished jobs
+
+    def getVersion(self, function):
+        return self.versions.get(id(function), 0)
+
+    def forget(self, live):
+        # drop state for functions no longer plotted; `live` is a set of ids. jobs in flight finish on their own
+        # and keep nothing, since nothing wants them any more
+        with self.lock:
+            for table in (self.finished, self.wanted, self.failed, self.versions):
+                for key in table.keys() - live:
+                    del table[key]
+
+    def request(self, function, request):
+        # newest finished (request, xs, ys) for the function, or None if it has never been sampled
+        key = id(function)
+        with self.lock:
+            finished = self.finished.get(key)
+            if finished is not None and finished[0] is not function:
+                finished = None
+            if finished is None or finished[1] != request:
+                self.wanted[key] = request
+                if key not in self.running and self.failed.get(key) != request:
+                    self.submit(function, request)
+        return finished and finished[1:]
+
+    def run(self, job):
+        # any other work to do off the render thread; the view hears when it is done, however it ended
+        def work():
+            try:
+                job()
+            finally:
+                if self.onReady is not None:
+                    self.onReady()
+        self.executor.submit(work)
+
+    def submit(self, function, request):
+        self.running[id(function)] = request
+        self.executor.submit(self.work, function, request)
+
+    def work(self, function, request):
+        key = id(function)
+        samples = None
+        try:
+            revision, step, start, stop, tolerance, budget, visible = request
+            samples = function.sample(step, start, stop, tolerance, budget, visible)
+        finally:
+            # however the job ended, the newest request gets its turn and the view hears about it
+            with self.lock:
+                self.running.pop(key, None)
+                wanted = self.wanted.get(key)
+                if samples is None:
+                    self.failed[key] = request
+                elif wanted is not None and function.revision == revision:
+                    self.finished[key] = (function, request, *samples)
+                    self.versions[key] = self.versions.get(key, 0) + 1
+                if wanted is not None and wanted != request:
+                    self.submit(function, wanted)
+            if self.onReady is not None:
+                self.onReady()
+
+class lineStyle:
+    # draws a whole polyline in one of the linetype styles from arrays of screen coordinates.
+    # `progress` is arc length in pixels; each style returns it advanced by the polyline's length,
+    # so patterns carry on from one polyline to the next.
+    dashPeriod = 16 # pixels from the start of one dash to the next
+    squiggleScale = 8 # squiggle phase per pixel
+    squiggleSpacing = 4 # pixels between the points a squiggle is drawn through
 
     @staticmethod
-    def drawSquiggly(surface, lineWidth, lineColor, progress):
-        p1 = yield
-        while (p2 := (yield)) != None:
-            # do something
-            dx = p2[0] - p1[0]
-            dy = p2[1] - p1[1]
-            normal = math.atan2(dy, dx) + NINETYDEG
-            offset = (math.sin(progress / 80) * 1.5) + (math.sin((progress / 100) + 2) * 2) + (math.sin(progress / 200) * 3)
-            dx = math.cos(normal) * offset
-            dy = math.sin(normal) * offset
-            p2 = p2[0] + dx, p2[1] + dy
-            p1 = p2
+    def getArcLength(xs, ys, progress):
+        return progress + numpy.concatenate(([0], numpy.cumsum(numpy.hypot(numpy.diff(xs), numpy.diff(ys)))))
+
+    @classmethod
+    def drawSolid(cls, surface, xs, ys, lineWidth, lineColor, progress):
+        pygame.draw.lines(surface, lineColor, False, numpy.column_stack((xs, ys)).tolist(), lineWidth)
+        return cls.getArcLength(xs, ys, progress)[-1]
+
+    @classmethod
+    def drawDotted(cls, surface, xs, ys, lineWidth, lineColor, progress):
+        # on wherever sin(2 pi s / dashPeriod) > 0: every dash is cut out of the polyline at its exact arc length
+        s = cls.getArcLength(xs, ys, progress)
+        half = cls.dashPeriod / 2
+        cuts = numpy.arange(math.ceil(s[0] / half), math.floor(s[-1] / half) + 1) * half
+        cuts = numpy.concatenate(([s[0]], cuts[(cuts > s[0]) & (cuts < s[-1])], [s[-1]]))
+        cutXs, cutYs = numpy.interp(cuts, s, xs), numpy.interp(cuts, s, ys)
+        inner = numpy.searchsorted(s, cuts, side="right")
+        for index in numpy.flatnonzero(numpy.floor((cuts[:-1] + cuts[1:]) / 2 / half) % 2 == 0).tolist():
+            vertices = slice(inner[index], inner[index + 1])
+            points = numpy.column_stack((
+                    numpy.concatenate(([cutXs[index]], xs[vertices], [cutXs[index + 1]])),
+                    numpy.concatenate(([cutYs[index]], ys[vertices], [cutYs[index + 1]]))))
+            pygame.draw.lines(surface, lineColor, False, points.tolist(), lineWidth)
+        return s[-1]
+
+    @classmethod
+    def drawSquiggly(cls, surface, xs, ys, lineWidth, lineColor, progress):
+        # resampled evenly along its length and pushed along the normal by a sum of sines of the arc length
+        s = cls.getArcLength(xs, ys, progress)
+        even = numpy.append(numpy.arange(s[0], s[-1], cls.squiggleSpacing), s[-1])
+        pointXs, pointYs = numpy.interp(even, s, xs), numpy.interp(even, s, ys)
+        if len(even) > 1:
+            dx, dy = numpy.gradient(pointXs), numpy.gradient(pointYs)
+            length = numpy.hypot(dx, dy)
+            length[length == 0] = 1
+            phase = even * cls.squiggleScale
+            offset = numpy.sin(phase / 80) * 1.5 + numpy.sin(phase / 100 + 2) * 2 + numpy.sin(phase / 200) * 3
+            pointXs, pointYs = pointXs - dy / length * offset, pointYs + dx / length * offset
+        pygame.draw.lines(surface, lineColor, False, numpy.column_stack((pointXs, pointYs)).tolist(), lineWidth)
+        return s[-1]
+
+class projection:
+    # a world region drawn onto `size` pixels. drawing goes straight to screen resolution through this,
+    # so the cost of a frame follows the window size rather than how much of the world is in view.
+    def __init__(self, region, size=None):
+        left, top, width, height = region
+        self.left, self.top = float(left), float(top)
+        self.width, self.height = float(width), float(height)
+        self.size = tuple(size or (round(width), round(height)))
+        self.scaleX = self.width / self.size[0] # world units per pixel
+        self.scaleY = self.height / self.size[1]
+
+    def __iter__(self):
+        return iter((self.left, self.top, self.width, self.height))
+
+    @property
+    def right(self):
+        return self.left + self.width
+
+    @property
+    def bottom(self):
+        return self.top + self.height
+
+    def getKey(self):
+        return tuple(self), self.size
+
+    def toScreenX(self, x):
+        return (x - self.left) / self.scaleX
+
+    def toScreenY(self, y):
+        return (y - self.top) / self.scaleY
+
+    def toPixels(self, width):
+        # widths are given in world units, as they were when the world was drawn 1:1 and scaled to the window
+        return 0 if width <= 0 else max(1, round(width / self.scaleX))
+
+    def inflate(self, pixels):
+        return projection((self.left - pixels * self.scaleX, self.top - pixels * self.scaleY,
+                self.width + 2 * pixels * self.scaleX, self.height + 2 * pixels * self.scaleY),
+                (self.size[0] + 2 * pixels, self.size[1] + 2 * pixels))
+
+class layer:
+    # a persistent surface that is only redrawn when its region or key changes
+    def __init__(self, draw, transparent=True):
+        self.draw = draw
+        self.transparent = transparent
+        self.surface = None
+        self.key = None
+
+    def invalidate(self):
+        self.key = None
+
+    def get(self, region, key):
+        key = (region.getKey(), key)
+        if self.surface is None or self.surface.get_size() != region.size:
+            flags = pygame.SRCALPHA if self.transparent else 0
+            self.surface = pygame.Surface(region.size, flags)
+            self.key = None
+        if key != self.key:
+            if self.transparent:
+                self.surface.fill((0, 0, 0, 0))
+            self.draw(region, self.surface)
+            self.key = key
+        return self.surface
 
 class grid:
-    plotMethods = [lineStyleGenerators.drawSolid, lineStyleGenerators.drawDotted, lineStyleGenerators.drawSquiggly]
+    plotMethods = [lineStyle.drawSolid, lineStyle.drawDotted, lineStyle.drawSquiggly]
+    tilePadding = 16
     def __init__(self, settings=None):
-        self.settings = settings or gridSettings
+        self.settings = settings or gridSettings()
         self.functions = []
+        self.revision = 0
+        self.pool = None # samplingPool to sample off the render thread
+        self.profiler = None # profiling.profiler timing each stage, when set
+        self.interactive = False # reduced detail while the view is being dragged or zoomed
+        self.samplingRegion = None # region the sampling step and y band follow, when drawing part of a view
+        self.sampleRange = None # (left, right) asked of the pool, when drawing part of what a frame covers
+        self.complete = True # false once a render drew samples the pool has not finished yet
+        self.surface = None
+        self.gridLayer = layer(self.drawBackground, transparent=False)
+        self.functionLayers = {} # id(function): (function, layer)
+        self.labels = labels.labeler()
+        self.labelLayer = layer(self.labelAxes)
+        self.analyzer = analysis.analyzer()
+        self.analysis = None # results the marker layer is drawing
+        self.markerLayer = layer(self.drawMarkers)
     @staticmethod
     def translateToRegion(point, region):
         point = point[0] - region.left, point[1] - region.top
         return point
 
-    def drawGridlinesForAxis(self, region, surface, axis):
-        if axis == "x":
-            transform = (0, 1)
-            rng = (region.left, region.right)
-        elif axis == "y":
-            rng = (region.top, region.bottom)
-            transform = (1, 0)
-        else:
-            raise ValueError(f"axis should be \"x\" or \"y\"; got {axis}")
+    def thinInterval(self, interval, scale, pixels):
+        # with pixelSizes, intervals are also spaced about as many pixels apart as they are units, the way the
+        # viewer shows them at one pixel per unit, so an image of any viewport has a grid and labels to read
+        if self.settings.pixelSizes:
+            return labels.thinInterval(interval, scale, max(pixels, interval), fill=True)
+        return labels.thinInterval(interval, scale, pixels)
+
+    def getGridlines(self, low, high, scale=None):
+        # (grade, lineweight) for every gridline in [low, high), stepping through multiples of the divisions.
+        # with `scale`, in world units per pixel, lines closer than minGridSpacing pixels are left out: first the
+        # subdivisions, then every other major line as often as needed, so a frame draws O(screen) lines at any zoom
         frequency, subdivision = self.settings.gridDivision
-        for grade in range(*rng):
-            lineweight = 0
+        if self.interactive and not self.settings.interactiveMinorGridlines:
+            subdivision = 1
+        if scale is not None:
+            frequency = self.thinInterval(frequency, scale, self.settings.minGridSpacing)
+            if frequency / subdivision / scale < self.settings.minGridSpacing:
+                subdivision = 1
+        minor = frequency / subdivision
+        grades = {0} if low <= 0 < high else set()
+        for spacing in (frequency, minor):
+            grades.update(round(k * spacing) for k in range(math.ceil(low / spacing), math.ceil(high / spacing)))
+        lines = []
+        for grade in sorted(grades):
+            if not low <= grade < high:
+                continue
             if grade == 0:
                 lineweight = self.settings.lineWeightAxis
             elif (grade % frequency) == 0:
@@ -106,124 +583,445 @@ class grid:
                 lineweight = self.settings.lineWeightMinor
             else:
                 continue
+            lines.append((grade, lineweight))
+        return lines
+
+    def drawGridlinesForAxis(self, region, surface, axis):
+        if axis == "x":
+            rng = (region.left, region.right)
+        elif axis == "y":
+            rng = (region.top, region.bottom)
+        else:
+            raise ValueError(f"axis should be \"x\" or \"y\"; got {axis}")
+        color = self.settings.lineColor
+        width, height = region.size
+        for grade, lineweight in self.getGridlines(*rng, region.scaleX if axis == "x" else region.scaleY):
+            # axis-aligned lines are plain fills, matching the pixels pygame.draw.line would cover
+            lineweight = self.toPixels(region, lineweight)
+            offset = (lineweight - 1) // 2
             if axis == "x":
-                newLine = (grade - region.left, 0), (grade - region.left, region.height * transform[1])
-            elif axis == "y":
-                newLine = (0, grade - region.top), (region.width * transform[0], grade - region.top)
-            pygame.draw.line(surface, self.settings.lineColor, *newLine, lineweight)
+                surface.fill(color, (round(region.toScreenX(grade)) - offset, 0, lineweight, height + 1))
+            else:
+                surface.fill(color, (0, round(region.toScreenY(grade)) - offset, width + 1, lineweight))
 
     def drawGridlines(self, region, surface):
         self.drawGridlinesForAxis(region, surface, "x")
         self.drawGridlinesForAxis(region, surface, "y")
 
-    def plotSegment(self, surface, p1, p2, lineColor, lineWidth, lineType, step, progress):
-        dx, dy = p2[0] - p1[0], p2[1] - p1[1]
-        differences = signof(dx), signof(dy)
-        normal = math.atan2(dy, dx)
-        magnitude = math.hypot(dx, dy)
-        plotter = self.plotMethods[lineType](surface, lineWidth, lineColor, progress)
-        start(plotter)
-        if p1 != p2:
-            increment = (dx/magnitude) * step, (dy/magnitude) * step
-        while (signof(dx), signof(dy)) == differences:
-            p1 = increment[0] + p1[0], increment[1] + p1[1]
-            plotter.send(p1)
-            dx = p2[0] - p1[0]
-            dy = p2[1] - p1[1]
-        return magnitude # as progress
-
-    def plotPath(self, surface, path, lineWidth, lineColor, lineType, step = 1):
-        progress = 0
+    def plotPolyline(self, surface, xs, ys, lineWidth, lineColor, lineType, progress=0):
+        # returns the progress to carry on to the next polyline of the same curve
+        if len(xs) < 2 or lineWidth <= 0:
+            return progress
+        return self.plotMethods[lineType](surface, xs, ys, lineWidth, lineColor, progress)
+
+    def plotPath(self, surface, path, lineWidth, lineColor, lineType, progress=0):
         if not path:
-            return
-        lastPoint = path[0]
-        for nextPoint in path[1:]:
-            progress += self.plotSegment(surface, lastPoint, nextPoint, lineColor, lineWidth, lineType, step, progress)
-            #lastPoint = nextPoint
+            return progress
+        xs, ys = numpy.array(path, dtype=float).T
+        return self.plotPolyline(surface, xs, ys, lineWidth, lineColor, lineType, progress)
 
     def plotPathFast(self, surface, path, lineWidth, lineColor, *_):
-        if not path:
-            return
-        lastPoint = path.pop(0)
-        for nextPoint in path:
-            pygame.draw.line(surface, lineColor, lastPoint, nextPoint, lineWidth)
-            lastPoint = nextPoint
-
-    def graphFunctions(self, region, surface):
-        lineSurface = pygame.Surface((region.width, region.height))
-        lineSurface.set_colorkey((255, 255, 255))
-        for function in self.functions:
-            if not function.settings.visible:
+        if len(path) > 1:
+            pygame.draw.lines(surface, lineColor, False, path, lineWidth)
+
+    def getSampling(self, region):
+        # shared base sampling step and index range for a region; base samples sit at x = k * step
+        segments = self.settings.functionSegments
+        if self.interactive:
+            segments = max(segments // self.settings.interactiveSampleScale, 2)
+        # a power of two, so small zoom steps keep the same base samples
+        step = 2.0 ** math.floor(math.log2((self.samplingRegion or region).width / segments))
+        return step, math.floor(region.left / step), math.ceil(region.right / step) + 1
+
+    def getTolerance(self, region):
+        # the pixel tolerance in world units, also rounded to a power of two so cached samples survive a zoom step
+        tolerance = self.settings.sampleTolerance
+        if self.interactive:
+            tolerance *= self.settings.interactiveSampleScale
+        return tolerance * 2.0 ** math.floor(math.log2((self.samplingRegion or region).scaleY))
+
+    def sampleFunctions(self, region, functions=None):
+        # adaptively sampled (xs, ys) per visible function, reusing cached samples.
+        if functions is None:
+            functions = self.functions
+        step, start, stop = self.getSampling(region)
+        settings = self.settings
+        visible = (-(self.samplingRegion or region).bottom, -(self.samplingRegion or region).top)
+        tolerance, budget = self.getTolerance(region), settings.maxFunctionEvaluations
+        if self.interactive:
+            budget //= settings.interactiveSampleScale
+        samples = []
+        for function in functions:
+            if not function.settings.visible or function.kind != "function":
                 continue
-            lineSurface.fill((255, 255, 255))
-            color = function.settings.lineColor
-            width = function.settings.lineWidth
-            typ = function.settings.lineType
-
-            path = []
-            rng = range(region.left, region.right + 1)
-            segments = len(rng)
-            maxSegments = self.settings.maxFunctionSegments
-            step = max(segments // maxSegments, 1)
-            yValues = [None, None, None]
-            for x in range(rng.start, rng.stop, step):
-                if yValues[1] is None:
-                    yValues[1] = -function.call(x)
-                yValues[2] = -function.call(x + 1)
-                y = yValues[1]
-                point = (x, y)
-                point = grid.translateToRegion(point, region)
-                onScreen = False
-                for yValue in yValues:
-                    if yValue is None:
-                        continue
-                    if (0 < (yValue - region.top) < region.height):
-                        onScreen = True
-                if onScreen:
-                    path.append(point)
-                yValues = [yValues[1], yValues[2], None]
-            self.plotPath(surface, path, width, color, typ, 10)
+            if self.pool is None:
+                xs, ys = function.sample(step, start, stop, tolerance, budget, visible)
+            else:
+                # the whole range a frame covers is asked for at once, so all of its tiles share one job per function
+                left, right = self.sampleRange or (region.left, region.right)
+                request = (function.revision, step, math.floor(left / step), math.ceil(right / step) + 1,
+                        tolerance, budget, visible)
+                finished = self.pool.request(function, request)
+                if finished is not None and finished[0] != request:
+                    self.complete = False # older samples, shown until the new ones land
+                if finished is not None and len(finished[1]) and finished[1][0] <= region.left and finished[1][-1] >= region.right:
+                    _, xs, ys = finished
+                    low = max(numpy.searchsorted(xs, region.left, side="right") - 1, 0)
+                    high = numpy.searchsorted(xs, region.right, side="left") + 1
+                    xs, ys = xs[low:high], ys[low:high]
+                else:
+                    # nothing to show yet: a coarse, unrefined pass until the workers catch up
+                    self.complete = False
+                    coarse = step * 4
+                    xs = numpy.arange(start * step // coarse, -(-stop * step // coarse) + 1, dtype=float) * coarse
+                    ys = function.callArray(xs)
+            samples.append((function, xs, -ys))
+        return samples
+
+    def getPolylines(self, region, xs, ys, margin=0):
+        # screen coordinates split into separate polylines wherever a value is undefined, with every segment
+        # clipped to the region (grown by `margin` pixels), so nothing is drawn or walked off screen.
+        x0, y0, x1, y1 = xs[:-1], ys[:-1], xs[1:], ys[1:]
+        finite = numpy.isfinite(x0) & numpy.isfinite(y0) & numpy.isfinite(x1) & numpy.isfinite(y1)
+        x0, y0, x1, y1 = (numpy.where(finite, v, 0) for v in (x0, y0, x1, y1))
+        width, height = region.size
+        t0, t1, keep = clipSegments(x0, y0, x1, y1, (-margin, -margin, width + margin, height + margin))
+        keep &= finite
+        segments = numpy.flatnonzero(keep)
+        if not len(segments):
+            return []
+        # a polyline carries on into the next segment only if neither side of the shared point was clipped
+        joined = (segments[1:] == segments[:-1] + 1) & (t1[segments[:-1]] == 1) & (t0[segments[1:]] == 0)
+        dx, dy = x1 - x0, y1 - y0
+        polylines = []
+        for run in numpy.split(segments, numpy.flatnonzero(~joined) + 1):
+            polylines.append((
+                    numpy.concatenate(([x0[run[0]] + t0[run[0]] * dx[run[0]]], x0[run] + t1[run] * dx[run])),
+                    numpy.concatenate(([y0[run[0]] + t0[run[0]] * dy[run[0]]], y0[run] + t1[run] * dy[run]))))
+        return polylines
+
+    def graphFunctions(self, region, surface, functions=None):
+        for function in self.functions if functions is None else functions:
+            with profiling.timed(self.profiler, f"function {function.name}"):
+                if function.kind == "parametric":
+                    self.graphParametric(region, surface, function)
+                elif function.kind == "implicit":
+                    self.graphImplicit(region, surface, function)
+                elif function.kind == "series":
+                    self.graphSeries(region, surface, function)
+                else:
+                    for function, xs, ys in self.sampleFunctions(region, [function]):
+                        # huge finite samples overflow to inf on screen, which drawCurve clips like any other
+                        with numpy.errstate(all="ignore"):
+                            xs, ys = region.toScreenX(xs), region.toScreenY(ys)
+                        self.drawCurve(region, surface, function, xs, ys)
         return
-    
-    def labelXAxis(self, region, surface):
-        renderer = pygame.freetype.SysFont(pygame.freetype.get_default_font(), self.settings.labelScale)
-        _, minBox = renderer.render("012345679")
-        minHeight = minBox[1]
-        minWidth = minBox[0]
-        xAxis = -region.left
-        yAxis = region.bottom
+
+    def drawCurve(self, region, surface, function, xs, ys):
+        # screen coordinates joined in order, in the function's line style, broken where they are undefined
+        s = function.settings
+        lineWidth = self.toPixels(region, s.lineWidth)
+        progress = None
+        for polylineXs, polylineYs in self.getPolylines(region, xs, ys, lineWidth + 2):
+            if progress is None:
+                # patterns start from the curve's first x on the whole world's pixel grid rather than from the edge
+                # of whatever is being drawn, so they line up across tiles for curves that are not too steep
+                progress = region.left / region.scaleX + polylineXs[0]
+            progress = self.plotPolyline(surface, polylineXs, polylineYs, lineWidth, s.lineColor, s.lineType, progress)
+
+    def graphParametric(self, region, surface, curve):
+        if not curve.settings.visible:
+            return
+        samples = curve.samples
+        if self.interactive:
+            samples = max(samples // self.settings.interactiveSampleScale, 2)
+        xs, ys = curve.sample(samples)
+        with numpy.errstate(all="ignore"):
+            xs, ys = region.toScreenX(xs), region.toScreenY(-ys)
+        self.drawCurve(region, surface, curve, xs, ys)
+
+    def graphSeries(self, region, surface, series):
+        # recorded data (see series.py), read at about one value pair per pixel column
+        if not series.settings.visible:
+            return
+        columns = region.size[0]
+        if self.interactive:
+            columns = max(columns // self.settings.interactiveSampleScale, 2)
+        xs, ys = series.sample(region.left, region.right, columns)
+        self.drawCurve(region, surface, series, region.toScreenX(xs), region.toScreenY(-ys))
+
+    def graphImplicit(self, region, surface, field):
+        # the field at the centre of every cell, in one call, scaled up to the region
+        if not field.settings.visible:
+            return
+        cell = self.settings.implicitCellSize
+        if self.interactive:
+            cell *= self.settings.interactiveSampleScale
+        columns, rows = -(-region.size[0] // cell), -(-region.size[1] // cell)
+        xs = region.left + (numpy.arange(columns) + 0.5) * cell * region.scaleX
+        ys = -(region.top + (numpy.arange(rows) + 0.5) * cell * region.scaleY)
+        rgba = field.getColors(field.evaluate(xs, ys), cell)
+        image = pygame.Surface((columns, rows), pygame.SRCALPHA)
+        pygame.surfarray.pixels3d(image)[...] = rgba[..., :3]
+        pygame.surfarray.pixels_alpha(image)[...] = rgba[..., 3]
+        surface.blit(pygame.transform.scale(image, (columns * cell, rows * cell)), (0, 0))
+
+    def toPixels(self, region, width):
+        # a line weight or width on screen: world units scaled to the region, or pixels with pixelSizes
+        if self.settings.pixelSizes:
+            return 0 if width <= 0 else max(1, round(width))
+        return region.toPixels(width)
+
+    def getLabelSize(self, region):
+        size = self.settings.labelScale if self.settings.pixelSizes else round(self.settings.labelScale / region.scaleY)
+        return min(max(1, size), self.labels.maxSize)
+
+    def labelYAxis(self, region, surface):
+        # values along the vertical axis, pinned to the nearest edge when the axis is off screen
+        size = self.getLabelSize(region)
+        height = self.labels.getHeight(size) * region.scaleY
+        xAxis = region.toScreenX(0)
         direction = "right"
         if region.right < 0:
-            xAxis = region.width
+            xAxis = region.size[0]
             direction = "left"
         elif region.left > 0:
             xAxis = 0
-        for i in range(region.top - minHeight, region.bottom):
-            if i % self.settings.labelYInterval == 0:
-                iGlobal = i - region.top
-                newLabel, rect = renderer.render(str(-i))
-                offset = [2, 2]
-                if direction == "left":
-                    offset[0] = -offset[0] -rect.width
-                surface.blit(newLabel, (xAxis + offset[0], iGlobal + offset[1]))
-
-    def render(self, region):
-        region = pygame.Rect(region)
-
-        surface = pygame.Surface((region.size))
-        surface.fill(self.settings.gridColor)
-        self.drawGridlines(region, surface)
-        self.graphFunctions(region, surface)
-        self.labelXAxis(region, surface)
+        interval = self.thinInterval(self.settings.labelYInterval, region.scaleY, self.settings.minLabelSpacing)
+        for i in labels.multiplesIn(interval, math.floor(region.top - height), math.ceil(region.bottom)):
+            newLabel, rect = self.labels.render(str(-i), size)
+            offset = [2, 2]
+            if direction == "left":
+                offset[0] = -offset[0] - rect.width
+            surface.blit(newLabel, (round(xAxis + offset[0]), round(region.toScreenY(i) + offset[1])))
+
+    def labelXAxis(self, region, surface):
+        # values along the horizontal axis, pinned to the nearest edge when the axis is off screen
+        size = self.getLabelSize(region)
+        height = self.labels.getHeight(size)
+        yAxis = region.toScreenY(0)
+        direction = "down"
+        if region.bottom < 0:
+            yAxis = region.size[1]
+            direction = "up"
+        elif region.top > 0:
+            yAxis = 0
+        # far enough apart for the widest label in view, too
+        extreme = -math.ceil(max(abs(region.left), abs(region.right)))
+        widest = self.labels.render(str(extreme), size)[1].width + 8
+        interval = self.thinInterval(self.settings.labelXInterval, region.scaleX, max(self.settings.minLabelSpacing, widest))
+        for i in labels.multiplesIn(interval, math.floor(region.left) - max(interval, 0), math.ceil(region.right)):
+            if i == 0:
+                continue # already labelled on the vertical axis
+            newLabel, rect = self.labels.render(str(i), size)
+            offset = [2, 2]
+            if direction == "up":
+                offset[1] = -offset[1] - height
+            surface.blit(newLabel, (round(region.toScreenX(i) + offset[0]), round(yAxis + offset[1])))
+
+    def labelAxes(self, region, surface):
+        with profiling.timed(self.profiler, "labels"):
+            self.labelXAxis(region, surface)
+            self.labelYAxis(region, surface)
+
+    def getAnalysis(self, region, interactive=False):
+        # zeros, extrema and intersections of the visible y = f(x) curves across `region`, one sample per pixel column.
+        # while interacting, the last results are kept rather than searching again on every frame. with a pool, the
+        # search runs there, so it never holds up a frame, and the markers appear on a later one
+        functions = [f for f in self.functions if f.settings.visible and f.kind == "function"]
+        run = None if self.pool is None else self.pool.run
+        with profiling.timed(self.profiler, "analysis"):
+            return self.analyzer.analyze(functions, region.left, region.right, region.size[0], region.scaleY, interactive,
+                    run)
+
+    def drawMarkers(self, region, surface):
+        radius = self.settings.analysisMarkerRadius
+        results = self.analysis
+        functions = [f for f in self.functions if f.settings.visible and f.kind == "function"]
+        # roots filled in the curve's colour, extrema as rings, intersections white with a black outline
+        for name, width in (("roots", 0), ("minima", 2), ("maxima", 2), ("intersections", 0)):
+            xs, ys, owners, _ = results[name]
+            onScreen = (xs >= region.left) & (xs <= region.right) & (-ys >= region.top) & (-ys <= region.bottom)
+            for x, y, owner in zip(region.toScreenX(xs[onScreen]), region.toScreenY(-ys[onScreen]), owners[onScreen]):
+                center = (round(x), round(y))
+                if name == "intersections":
+                    pygame.draw.circle(surface, (255, 255, 255), center, radius)
+                    pygame.draw.circle(surface, (0, 0, 0), center, radius, 1)
+                else:
+                    pygame.draw.circle(surface, functions[owner].settings.lineColor, center, radius, width)
+
+    def renderMarkers(self, region, size=None, interactive=False):
+        # transparent overlay of analysis markers for a whole view, or None when they are off
+        settings = self.settings
+        if not settings.showAnalysis:
+            return None
+        region = projection(region, size)
+        self.analysis = self.getAnalysis(region, interactive)
+        colors = tuple(f.settings.lineColor for f in self.functions if f.settings.visible and f.kind == "function")
+        return self.markerLayer.get(region, (self.analysis["version"], settings.analysisMarkerRadius, colors))
+
+    def drawBackground(self, region, surface):
+        with profiling.timed(self.profiler, "gridlines"):
+            surface.fill(self.settings.gridColor)
+            self.drawGridlines(region, surface)
+
+    def getFunctionLayer(self, function):
+        owner, cached = self.functionLayers.get(id(function), (None, None))
+        if owner is not function:
+            cached = layer(lambda region, surface: self.graphFunctions(region, surface, [function]))
+            self.functionLayers[id(function)] = (function, cached)
+        return cached
+
+    def prune(self):
+        # lets go of layers and pooled samples of functions no longer plotted; every way of rendering calls this
+        live = {id(function) for function in self.functions}
+        for stale in self.functionLayers.keys() - live:
+            del self.functionLayers[stale]
+        if self.pool is not None:
+            self.pool.forget(live)
+
+    def render(self, region, size=None, interactive=False):
+        # composite of separately cached layers; each is only redrawn when its own inputs change.
+        # the world `region` is drawn straight onto a surface of `size` pixels, by default one pixel per world unit.
+        # `interactive` renders a cheaper frame: fewer samples, no minor gridlines and no labels unless configured.
+        region = projection(region, size)
+        settings = self.settings
+        self.interactive = interactive
+        if self.surface is None or self.surface.get_size() != region.size:
+            self.surface = pygame.Surface(region.size)
+        surface = self.surface
+
+        surface.blit(self.gridLayer.get(region, self.getGridKey(interactive)), (0, 0))
+
+        self.prune()
+        for function in self.functions:
+            if not function.settings.visible:
+                continue
+            key = self.getFunctionKey(function, interactive), self.getSampleVersion(function)
+            surface.blit(self.getFunctionLayer(function).get(region, key), (0, 0))
+
+        for overlay in (self.renderMarkers(region, region.size, interactive),
+                self.renderLabels(region, region.size, interactive)):
+            if overlay is not None:
+                surface.blit(overlay, (0, 0))
         return surface
 
+    def renderLabels(self, region, size=None, interactive=False):
+        # transparent label overlay for a whole view, or None when labels are off for this detail level
+        settings = self.settings
+        if interactive and not settings.interactiveLabels:
+            return None
+        labelKey = (settings.labelScale, settings.labelXInterval, settings.labelYInterval, settings.minLabelSpacing,
+                settings.pixelSizes)
+        return self.labelLayer.get(projection(region, size), labelKey)
+
+    def renderTile(self, region, size, viewport, interactive=False, sampleRange=None, function=None):
+        # (surface, complete) for one piece of `viewport` (a projection): its gridlines, or with `function`, that curve
+        # alone on a transparent tile, sampled as it would be for the whole view. with `sampleRange`, the (left, right)
+        # every tile of the frame lies in, curves come from the pool, so the render thread never samples; a tile drawn
+        # before its samples land is drawn coarse and not complete. without, curves are sampled here, as on a
+        # background thread. draws through a shallow copy so it is safe to call from another thread while the grid renders.
+        view = copy.copy(self)
+        view.pool = self.pool if sampleRange is not None else None
+        view.interactive = interactive
+        view.samplingRegion = viewport
+        view.complete = True
+        region = projection(region, size)
+        # drawn with a margin, so thick lines that cross the tile's edge are not cut short
+        padded = region.inflate(self.tilePadding)
+        if sampleRange is not None:
+            margin = self.tilePadding * region.scaleX
+            view.sampleRange = (sampleRange[0] - margin, sampleRange[1] + margin)
+        if function is None:
+            surface, clear = pygame.Surface(padded.size), None
+            view.drawBackground(padded, surface)
+        elif function.kind == "implicit":
+            # shaded, so it needs per-pixel alpha
+            surface, clear = pygame.Surface(padded.size, pygame.SRCALPHA), None
+            surface.fill((0, 0, 0, 0))
+            view.graphFunctions(padded, surface, [function])
+        else:
+            # lines are one solid colour, so any other colour can key out the rest, which blits far faster than alpha
+            clear = tuple(255 - channel for channel in function.settings.lineColor[:3])
+            surface = pygame.Surface(padded.size)
+            surface.fill(clear)
+            view.graphFunctions(padded, surface, [function])
+        tile = surface.subsurface((self.tilePadding, self.tilePadding, *region.size)).copy()
+        if clear is not None:
+            tile.set_colorkey(clear, pygame.RLEACCEL)
+        return tile, view.complete
+
+    def snapshot(self):
+        # a copy that later changes to the settings, the curves or their styles do not reach, to render on another
+        # thread exactly what was asked for when the work was submitted
+        view = copy.copy(self)
+        view.settings = copy.copy(self.settings)
+        view.functions = [copy.copy(f) for f in self.functions]
+        for f in view.functions:
+            f.settings = copy.copy(f.settings)
+        view.pool = None
+        return view
+
+    def getGridKey(self, interactive=False):
+        # equal whenever two renders of the gridlines over the same region would match
+        settings = self.settings
+        return (settings.gridColor, settings.lineColor, settings.gridDivision, settings.lineWeightAxis,
+                settings.lineWeightMajor, settings.lineWeightMinor, settings.minGridSpacing, settings.pixelSizes,
+                interactive and not settings.interactiveMinorGridlines)
+
+    def getFunctionKey(self, function, interactive=False):
+        # likewise for one curve, whatever else is plotted
+        settings = self.settings
+        return (function.revision, dataclasses.astuple(function.settings), interactive, settings.functionSegments,
+                settings.implicitCellSize, settings.sampleTolerance, settings.maxFunctionEvaluations,
+                settings.interactiveSampleScale, settings.pixelSizes)
+
+    def getLayers(self, interactive=False):
+        # (key, function) for what is drawn separately, bottom up: the gridlines, with None, then each visible curve.
+        # keys are made of values, so they repeat when settings return to an earlier state, e.g. when zooming back
+        layers = [(("grid",) + self.getGridKey(interactive), None)]
+        layers.extend((self.getFunctionKey(f, interactive), f) for f in self.functions if f.settings.visible)
+        return layers
+
+    def getEvaluations(self):
+        # function evaluations spent sampling each function so far, to find the expensive curves
+        return {f.name: f.countEvaluations() for f in self.functions}
+
+    def getSampleVersion(self, function):
+        return 0 if self.pool is None else self.pool.getVersion(function)
+
+    def getRevision(self):
+        # changes whenever anything that affects the rendered image changes
+        return self.revision, self.settings.revision, self.analyzer.version, tuple(
+                (f.revision, f.settings.revision, self.getSampleVersion(f)) for f in self.functions)
+
     def addFunc(self, func):
         self.functions.append(func)
+        self.revision += 1
+
+    def removeFunc(self, func):
+        # by identity; functions are dataclasses without fields, so any two compare equal
+        index = next(index for index, f in enumerate(self.functions) if f is func)
+        del self.functions[index]
+        self.revision += 1
     
     def addFuncFromString(self, string, lineColor = None, lineType = None, lineWidth = None):
-        infixExpression = postfix.strToInfix(string)
-        postfixExpression = postfix.infixToPostfix(infixExpression)
-        f = function(postfixExpression)
+        compiled = postfix.getExpression(string)
+        f = function(compiled.postfix, compiled=compiled, name=string)
+        self.addStyled(f, lineColor, lineType, lineWidth)
+
+    def addParametricFromStrings(self, xString, yString, tRange = None, lineColor = None, lineType = None, lineWidth = None):
+        # the curve (x(t), y(t)), e.g. ("(1 - t^2) / (1 + t^2) * 100", "2t / (1 + t^2) * 100") for a circle
+        expressions = [postfix.getExpression(string).postfix for string in (xString, yString)]
+        f = parametric(*expressions, tRange, name=f"({xString}, {yString})")
+        self.addStyled(f, lineColor, lineType, lineWidth)
+
+    def addImplicitFromString(self, string, lineColor = None):
+        # shades f(x, y) by sign and draws where it is zero
+        f = implicit(postfix.getExpression(string).postfix, name=string)
+        self.addStyled(f, lineColor)
+
+    def addStyled(self, f, lineColor = None, lineType = None, lineWidth = None):
         f.settings.lineType = lineType or f.settings.lineType
         f.settings.lineColor = lineColor or f.settings.lineColor
         f.settings.lineWidth = lineWidth or f.settings.lineWidth
@@ -0,0 +1,59 @@
+import pygame
+import pygame.freetype
+from collections import OrderedDict
+
+class labeler:
+    # fonts per size and rendered label surfaces, kept across frames; labels rarely change between frames.
+    maxLabels = 512
+    maxSize = 512 # pixels; zoomed far enough in, labels scaled with the world would outgrow what freetype will render
+
+    def __init__(self, maxLabels=None):
+        self.maxLabels = maxLabels or self.maxLabels
+        self.fonts = {} # size: (font, label height)
+        self.labels = OrderedDict() # (text, size): (surface, rect)
+        self.hits = 0
+        self.misses = 0
+
+    def getFont(self, size):
+        if size not in self.fonts:
+            if not pygame.freetype.get_init():
+                pygame.freetype.init()
+            # the bundled default font, which SysFont falls back to anyway after scanning every installed font
+            font = pygame.freetype.Font(None, size)
+            _, box = font.render("0123456789-")
+            self.fonts[size] = (font, box.height)
+        return self.fonts[size]
+
+    def getHeight(self, size):
+        return self.getFont(size)[1]
+
+    def render(self, text, size):
+        key = (text, size)
+        label = self.labels.get(key)
+        if label is None:
+            self.misses += 1
+            label = self.labels[key] = self.getFont(size)[0].render(text)
+            while len(self.labels) > self.maxLabels:
+                self.labels.popitem(last=False)
+        else:
+            self.hits += 1
+            self.labels.move_to_end(key)
+        return label
+
+def multiplesIn(interval, low, high):
+    # multiples of `interval` in [low, high); none for a non-positive interval
+    if interval <= 0:
+        return range(0)
+    return range(-(-low // interval) * interval, high, interval)
+
+def thinInterval(interval, scale, pixels, fill=False):
+    # `interval` doubled until its multiples are at least `pixels` apart at `scale` world units per pixel, so a view
+    # holds about as many of them at any zoom; non-positive intervals stay as they are. with `fill`, it is also
+    # halved while there is room for twice as many, as long as it stays a whole number
+    if interval <= 0 or scale <= 0:
+        return interval
+    while interval / scale < pixels:
+        interval *= 2
+    while fill and interval % 2 == 0 and interval / 2 / scale >= pixels:
+        interval //= 2
+    return interval
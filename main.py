@@ -1,3 +1,5 @@
+import time
+launched = time.perf_counter() # before the heavy imports, which are most of the time to first frame
 import camera
 
-camera.main()
+camera.main(launched)
@@ -1,4 +1,15 @@
 from dataclasses import dataclass
+from collections import OrderedDict
+from typing import Callable
+import os
+import math
+import re
+import types
+import marshal
+import hashlib
+import threading
+import importlib.util
+import numpy
 
 class operators(float):
     @staticmethod
@@ -29,10 +40,11 @@ class operator:
         if not name in cls.opMap:
             return name
         return cls.opMap[name]
-    def __init__(self, name, opBank=operators):
+    def __init__(self, name, opBank=operators, position=None):
         self.name = self.normalizeOp(name)
         self.binary = self.name in self.opBinary and not self.name in self.opUnary # redundant for explicit intention
         self.opBank = opBank
+        self.position = position
     def __call__(self, *args):
         return getattr(self.opBank, f"__{self.name}__")(*args)
     def __repr__(self):
@@ -40,56 +52,78 @@ class operator:
     def __str__(self):
         return repr(self)
 
-def getFloat(string):
-    val = None
-    isFullFloat = False
-    try:
-        float(string)
-        isFullFloat = True
-    except Exception as e:
-        pass # continue to partial check
-    if isFullFloat:
-        raise ValueError("cannot tell whether float is complete")
-    try:
-        val = float(string[:-1])
-        return val
-    except ValueError as e:
-        raise e # make explicit that "error if unparseable as float" is intended behavior here.
+class ParseError(ValueError):
+    def __init__(self, message, position=None, string=None):
+        self.position = position
+        self.string = string
+        if position is not None:
+            message = f"{message} at position {position}"
+            if string is not None:
+                message = f"{message}\n    {string}\n    {' ' * position}^"
+        super().__init__(message)
+
+class number(float):
+    # a float that remembers where it was read from
+    def __new__(cls, value, position=None):
+        self = super().__new__(cls, value)
+        self.position = position
+        return self
 
 class variable:
-    def __init__(self, string):
-        if string.isidentifier():
-            raise ValueError("cannot tell whether name is complete")
-        if not string[0:-1].isidentifier():
-            raise ValueError("not a valid variable")
-        self.name = string[0:-1]
+    def __init__(self, name, position=None):
+        if not name.isidentifier():
+            raise ValueError(f"`{name}` is not a valid variable")
+        self.name = name
+        self.position = position
     def __repr__(self):
         return f"{self.name}"
     __str__ = __repr__
 
+tokenPattern = re.compile(r"\s*(?:(?P<number>\d+\.?\d*|\.\d+)|(?P<name>[^\W\d]\w*)|(?P<operator>[-+*/^()]))")
+
 def strToInfix(string):
-    string = string.replace(" ", "")
-    string = f"({string})"
-    methods = [
-           #(method, consumesLastCharacter)
-            (getFloat, False),
-            (variable, False),
-            (operator, True)
-            ]
-    stack = mystack()
-    accum = ""
-    count = -1
-    while (count := count + 1) < len(string):
-        char = string[count]
-        accum += char
-        for method, consumesLast in methods:
-            try:
-                stack.push(method(accum))
-                accum = ""
-                if not consumesLast:
-                    count -= 1
-            except ValueError:
-                pass
+    # single left-to-right pass; the whole expression is wrapped in parentheses for infixToPostfix.
+    # every operand is checked for here, where positions can still be shown against the string
+    stack = mystack([operator("(")])
+    opened = [] # positions of unclosed parentheses
+    expectOperand = True # at the start, and after any operator but `)`
+    index = 0
+    end = len(string.rstrip())
+    while index < end:
+        match = tokenPattern.match(string, index)
+        if match is None:
+            position = len(string) - len(string[index:].lstrip())
+            raise ParseError(f"unexpected character `{string[position]}`", position, string)
+        kind = match.lastgroup
+        text = match.group(kind)
+        position = match.start(kind)
+        if kind == "number":
+            if string.startswith(".", match.end()):
+                malformed = re.match(r"[\d.]+", string[position:]).group()
+                raise ParseError(f"malformed number `{malformed}`", position, string)
+            stack.push(number(text, position))
+            expectOperand = False
+        elif kind == "name" and text not in operator.opMap:
+            stack.push(variable(text, position))
+            expectOperand = False
+        else:
+            if text == "(":
+                opened.append(position)
+            elif text == ")":
+                if not opened:
+                    raise ParseError("unmatched `)`", position, string)
+                opened.pop()
+            if expectOperand and text not in "-(":
+                # `-` with nothing before it is negation
+                raise ParseError(f"missing operand before `{text}`", position, string)
+            stack.push(operator(text, position=position))
+            expectOperand = text != ")"
+        index = match.end()
+    if opened:
+        raise ParseError("unclosed `(`", opened[-1], string)
+    if expectOperand:
+        raise ParseError(f"missing operand after `{text}`" if end else "empty expression", end, string)
+    stack.push(operator(")"))
     return stack
 
 def isPrior(item, compare):
@@ -102,39 +136,44 @@ def isPrior(item, compare):
     return False
 
 def addOperator(stack, operatorStack, op):
-    if len(operatorStack) == 0 or operatorStack[-1].name == "(" and op.name != ")":
+    if op.name == "(" or op.name in op.opUnary:
+        # prefix operators wait for their operand
         operatorStack.push(op)
         return
     if op.name == ")":
-        while (nextOp := operatorStack.pop()).name != "(":
+        while len(operatorStack) > 0:
+            nextOp = operatorStack.pop()
+            if nextOp.name == "(":
+                return
             stack.push(nextOp)
-        return
-    if isPrior(op.name, operatorStack[-1].name):
-        operatorStack.push(op)
-        return
-    stack.push(operatorStack.pop())
+        raise ParseError("unmatched `)`", op.position)
+    while len(operatorStack) > 0 and operatorStack[-1].name != "(" and not isPrior(op.name, operatorStack[-1].name):
+        stack.push(operatorStack.pop())
     operatorStack.push(op)
 
+def isOperand(item):
+    return isinstance(item, (variable, float, int)) or isinstance(item, operator) and item.name == ")"
+
 def infixToPostfix(infix):
     stack = mystack()
     operatorStack = mystack()
-    for index in range(len(infix)):
-        item = infix[index]
-        if isinstance(item, variable):
-            if (
-            len(stack) > 0 and isinstance(stack[-1], (float, int)) or
-            isinstance(infix[index-1], operator) and infix[index-1].name == ")"
-            ):
-                addOperator(stack, operatorStack, operator("*"))
-            stack.push(item)
-        if isinstance(item, (float, int)):
+    previous = None
+    for item in infix:
+        startsOperand = isinstance(item, (variable, float, int)) or isinstance(item, operator) and item.name == "("
+        if startsOperand and previous is not None and isOperand(previous):
+            # implicit multiplication, as in `2x` or `(x+1)(x-1)`
+            addOperator(stack, operatorStack, operator("*", position=getattr(item, "position", None)))
+        if isinstance(item, (variable, float, int)):
             stack.push(item)
-            continue
-        if isinstance(item, operator):
-            if (item.name == "sub" and (index == 0 or isinstance(infix[index - 1], operator))):
-                item = operator("neg")
+        elif isinstance(item, operator):
+            if item.name == "sub" and (previous is None or isinstance(previous, operator) and previous.name != ")"):
+                item = operator("neg", position=item.position)
             addOperator(stack, operatorStack, item)
-    stack.extend(operatorStack[::-1])
+        previous = item
+    for op in operatorStack[::-1]:
+        if op.name == "(":
+            raise ParseError("unclosed `(`", op.position)
+        stack.push(op)
     return stack
 
 def calculatePostfix(postfixList):
@@ -196,15 +235,532 @@ def getFunctionFromPostfix(expression):
         return calculatePostfix(newExpression)
     return f
 
+def arrayDivide(a, b):
+    return numpy.where(b == 0, numpy.nan, numpy.divide(a, b))
+
+def arrayPower(a, b):
+    return numpy.where((a == 0) & (b < 0), numpy.nan, numpy.power(a, b))
+
+def arrayResult(result, *args):
+    shape = numpy.broadcast_shapes(*(numpy.shape(arg) for arg in args))
+    if numpy.shape(result) != shape:
+        return numpy.full(shape, result, dtype=float)
+    return result
+
+temporaryPattern = re.compile(r"\bt\d+\b")
+
+class compiler:
+    symbols = {
+            "add": "+",
+            "sub": "-",
+            "mul": "*",
+            "truediv": "/",
+            "pow": "**"
+            }
+    namespace = {"inf": math.inf, "nan": math.nan}
+    coerce = "float({name})"
+    maxDepth = 32 # operations nested in one line; python's parser gives up at about 200 parentheses
+
+    @staticmethod
+    def fold(op, *values):
+        # leave anything that fails or leaves the reals to raise at call time, as the interpreter would.
+        try:
+            result = op(*values)
+        except (ArithmeticError, ValueError):
+            return None
+        if not isinstance(result, float):
+            return None
+        return result
+
+    @staticmethod
+    def constant(value):
+        if math.copysign(1, value) < 0:
+            return f"({value!r})"
+        return repr(value)
+
+    @classmethod
+    def binary(cls, name, a, b):
+        return f"({a} {cls.symbols[name]} {b})"
+
+    @classmethod
+    def unary(cls, name, a):
+        return f"(-{a})"
+
+    @classmethod
+    def body(cls, assignments, result, parameters):
+        return assignments + [f"return {result}"]
+
+    @classmethod
+    def emit(cls, expression, names):
+        # value numbering: every operation gets a temporary, and an operation whose source is already known
+        # reuses that temporary, which eliminates common subexpressions. temporaries used once are inlined again
+        # while that keeps lines shallow, so long generated sums become straight-line code rather than one deep line.
+        # each stack entry is (source, constant value or None)
+        stack = mystack()
+        temporaries = {} # source: name
+        order = [] # (name, source)
+        def intern(source):
+            if source not in temporaries:
+                temporaries[source] = f"t{len(order)}"
+                order.append((temporaries[source], source))
+            return temporaries[source]
+        for item in expression:
+            if isinstance(item, variable):
+                stack.push((names[item.name], None))
+                continue
+            if isinstance(item, (int, float)):
+                stack.push((cls.constant(float(item)), float(item)))
+                continue
+            if isinstance(item, operator):
+                arity = 2 if item.binary else 1
+                if len(stack) < arity:
+                    if item.binary:
+                        raise ValueError("attempt to perform binary operation on stack of length <=1")
+                    raise ValueError("attempt to perform unary operation on stack of length 0")
+                operands = stack[-arity:]
+                del stack[-arity:]
+                values = [value for _, value in operands]
+                if None not in values and (folded := cls.fold(item, *values)) is not None:
+                    stack.push((cls.constant(folded), folded))
+                elif item.binary:
+                    stack.push((intern(cls.binary(item.name, operands[0][0], operands[1][0])), None))
+                else:
+                    stack.push((intern(cls.unary(item.name, operands[0][0])), None))
+        if len(stack) > 1:
+            raise ValueError("unresolved expression")
+        result = stack[0][0]
+
+        uses = {}
+        for name in temporaryPattern.findall(" ".join([source for _, source in order] + [result])):
+            uses[name] = uses.get(name, 0) + 1
+        inlined = {}
+        depths = {} # inlined temporary: operations nested in its source
+        assignments = []
+        substitute = lambda source: temporaryPattern.sub(lambda match: inlined.get(match[0], match[0]), source)
+        for name, source in order:
+            depth = 1 + max((depths.get(operand, 0) for operand in temporaryPattern.findall(source)), default=0)
+            source = substitute(source)
+            if uses.get(name, 0) == 1 and depth < cls.maxDepth:
+                inlined[name] = source
+                depths[name] = depth
+            else:
+                assignments.append(f"{name} = {source}")
+        return assignments, substitute(result), len(order)
+
+    @classmethod
+    def build(cls, expression, variables=None):
+        # `variables` fixes argument order when `expression` was rewritten from a longer original
+        variables = variables or classifyVars(expression)
+        names = {v.name: f"v{v.position}" for v in variables.values()}
+        parameters = [names[name] for name in sorted(names, key=lambda name: variables[name].position)]
+        assignments, result, _ = cls.emit(expression, names)
+        lines = [f"def compiled({', '.join(parameters + ['*_'])}):"]
+        lines.extend(f"    {name} = {cls.coerce.format(name=name)}" for name in parameters)
+        lines.extend(f"    {line}" for line in cls.body(assignments, result, parameters))
+        source = "\n".join(lines)
+        namespace = dict(cls.namespace)
+        try:
+            code = compile(source, "<postfix>", "exec")
+        except (SyntaxError, RecursionError, MemoryError) as error:
+            raise ValueError(f"expression is too complex to compile: {error}") from error
+        exec(code, namespace)
+        f = namespace["compiled"]
+        f.source = source
+        return f
+
+    @classmethod
+    def load(cls, code, source):
+        # the function `build` made, from its code object, without generating or compiling anything
+        f = types.FunctionType(code, dict(cls.namespace), "compiled")
+        f.source = source
+        return f
+
+class arrayCompiler(compiler):
+    # same code generation over numpy arrays; division by zero and pow domain errors come back as nan.
+    namespace = {
+            **compiler.namespace,
+            "numpy": numpy,
+            "arrayDivide": arrayDivide,
+            "arrayPower": arrayPower,
+            "arrayResult": arrayResult
+            }
+    coerce = "numpy.asarray({name}, dtype=float)"
+
+    @classmethod
+    def binary(cls, name, a, b):
+        if name == "truediv":
+            return f"arrayDivide({a}, {b})"
+        if name == "pow":
+            return f"arrayPower({a}, {b})"
+        return super().binary(name, a, b)
+
+    @classmethod
+    def body(cls, assignments, result, parameters):
+        return [
+                "with numpy.errstate(all=\"ignore\"):",
+                *(f"    {line}" for line in assignments),
+                f"    result = {result}",
+                f"return arrayResult({', '.join(['result'] + parameters + ['*_'])})"
+                ]
+
+def postfixToTree(expression):
+    # nested tuples (operator name, *operands); variables and numbers are leaves
+    stack = mystack()
+    for item in expression:
+        if isinstance(item, operator):
+            arity = 2 if item.binary else 1
+            if len(stack) < arity:
+                if item.binary:
+                    raise ValueError("attempt to perform binary operation on stack of length <=1")
+                raise ValueError("attempt to perform unary operation on stack of length 0")
+            operands = tuple(stack[-arity:])
+            del stack[-arity:]
+            stack.push((item.name, *operands))
+        elif isinstance(item, variable):
+            stack.push(item)
+        else:
+            stack.push(float(item))
+    if len(stack) != 1:
+        raise ValueError("unresolved expression")
+    return stack[0]
+
+def walkTree(tree, leaf, combine):
+    # bottom-up over a tree without recursing, so machine-generated sums thousands of terms long are fine:
+    # leaf(tree) for every leaf, combine(operator name, [results of its operands]) for every operation
+    pending = [(tree, False)]
+    results = []
+    while pending:
+        node, ready = pending.pop()
+        if not isinstance(node, tuple):
+            results.append(leaf(node))
+        elif ready:
+            arity = len(node) - 1
+            operands = results[-arity:]
+            del results[-arity:]
+            results.append(combine(node[0], operands))
+        else:
+            pending.append((node, True))
+            pending.extend((operand, False) for operand in reversed(node[1:]))
+    return results[0]
+
+def treeToPostfix(tree, expression=None):
+    expression = mystack() if expression is None else expression
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, tuple):
+            # the operator goes out after its operands, which come off the stack first to last
+            pending.append(operator(node[0]))
+            pending.extend(reversed(node[1:]))
+        else:
+            expression.push(node)
+    return expression
+
+def isConstant(tree, value=None):
+    return isinstance(tree, float) and (value is None or tree == value)
+
+def simplifyTree(tree):
+    return walkTree(tree, lambda leaf: leaf, simplifyNode)
+
+def simplifyNode(name, operands):
+    # one operation whose operands are already simplified
+    if all(isinstance(operand, float) for operand in operands):
+        folded = compiler.fold(operator(name), *operands)
+        if folded is not None:
+            return folded
+    if name == "neg":
+        a, = operands
+        if isinstance(a, tuple) and a[0] == "neg":
+            return a[1]
+        return (name, a)
+    a, b = operands
+    if name == "add":
+        if isConstant(b, 0):
+            return a
+        if isConstant(a, 0):
+            return b
+    elif name == "sub":
+        if isConstant(b, 0):
+            return a
+        if isConstant(a, 0):
+            return ("neg", b)
+    elif name == "mul":
+        if isConstant(b, 1):
+            return a
+        if isConstant(a, 1):
+            return b
+        if isConstant(b, -1):
+            return ("neg", a)
+        if isConstant(a, -1):
+            return ("neg", b)
+    elif name == "truediv":
+        if isConstant(b, 1):
+            return a
+    elif name == "pow":
+        if isConstant(b, 1):
+            return a
+        if isConstant(b, 0):
+            return 1.0
+        if isConstant(b, 2):
+            # the repeated operand is shared again by the compiler's common subexpression elimination
+            return ("mul", a, a)
+    return (name, a, b)
+
+def optimizePostfix(expression):
+    # constant folding, identity removal (*1, +0, ^1, ...) and strength reduction (^2 -> *). the result may drop
+    # variables, so compile it with the original expression's classifyVars to keep argument positions.
+    return treeToPostfix(simplifyTree(postfixToTree(expression)))
+
+def sumTree(a, b, name="add"):
+    # a + b or a - b, folding zeros as they appear; differentiation makes a lot of them
+    if isConstant(b, 0):
+        return a
+    if isConstant(a, 0):
+        return b if name == "add" else ("neg", b)
+    return (name, a, b)
+
+def productTree(a, b):
+    if isConstant(a, 0) or isConstant(b, 0):
+        return 0.0
+    return ("mul", a, b)
+
+def differentiateTree(tree, name):
+    # d/d`name` of a tree from postfixToTree. a power with a variable exponent needs a logarithm, which there is
+    # no operator for, so it raises ValueError; callers fall back to finite differences.
+    def leaf(tree):
+        return tree, 1.0 if isinstance(tree, variable) and tree.name == name else 0.0
+    def combine(op, operands):
+        # (operation, its derivative) from (operand, its derivative) pairs
+        tree = (op, *(operand for operand, _ in operands))
+        if op == "neg":
+            derivative, = (derivative for _, derivative in operands)
+            return tree, 0.0 if isConstant(derivative, 0) else ("neg", derivative)
+        (a, da), (b, db) = operands
+        if op in ("add", "sub"):
+            return tree, sumTree(da, db, op)
+        if op == "mul":
+            return tree, sumTree(productTree(da, b), productTree(a, db))
+        if op == "truediv":
+            numerator = sumTree(productTree(da, b), productTree(a, db), "sub")
+            return tree, 0.0 if isConstant(numerator, 0) else ("truediv", numerator, ("mul", b, b))
+        if op == "pow":
+            if not isConstant(db, 0):
+                raise ValueError("cannot differentiate a power with a variable exponent")
+            return tree, productTree(productTree(b, ("pow", a, sumTree(b, 1.0, "sub"))), da)
+        raise ValueError(f"cannot differentiate `{op}`")
+    return walkTree(tree, leaf, combine)[1]
+
+def differentiatePostfix(expression, name):
+    # the derivative as optimized postfix; compile it with compilePostfixBatch, since it may lose the variable
+    return treeToPostfix(simplifyTree(differentiateTree(postfixToTree(expression), name)))
+
+def countOperations(expression):
+    # operations a compiled function performs per evaluation, after folding and common subexpression elimination
+    _, _, operations = compiler.emit(expression, {v.name: f"v{v.position}" for v in classifyVars(expression).values()})
+    return operations
+
+def compilePostfix(expression, optimize=True):
+    # drop-in for getFunctionFromPostfix: the expression becomes a single generated python function.
+    if optimize:
+        return compiler.build(optimizePostfix(expression), classifyVars(expression))
+    return compiler.build(expression)
+
+def compilePostfixArray(expression, optimize=True):
+    # like compilePostfix, but every argument may be an array and the result is an array of the broadcast shape.
+    if optimize:
+        return arrayCompiler.build(optimizePostfix(expression), classifyVars(expression))
+    return arrayCompiler.build(expression)
+
+def bindVariables(names):
+    # argument positions by name, so arguments keep their order whatever order the variables appear in
+    return {name: boundvariable(name, [], position) for position, name in enumerate(names)}
+
+def compilePostfixBatch(expression, names, optimize=True):
+    # array evaluation taking one argument per name in `names`, e.g. ("x", "y") for a field. arguments broadcast,
+    # so every point of a grid is evaluated in one call: f(xs[:, None], ys[None, :]).
+    unknown = classifyVars(expression).keys() - set(names)
+    if unknown:
+        raise ValueError(f"unknown variable {', '.join(sorted(unknown))}; expected only {', '.join(names)}")
+    if optimize:
+        expression = optimizePostfix(expression)
+    return arrayCompiler.build(expression, bindVariables(names))
+
+@dataclass
+class compiledExpression:
+    postfix: list
+    call: Callable
+    callArray: Callable
+
+def compileExpression(expression):
+    return compiledExpression(expression, compilePostfix(expression), compilePostfixArray(expression))
+
+def normalizeExpression(expression):
+    # identical for every spelling of the same optimized postfix, e.g. `2x`, `2 * x`, `(2)x` and `2x^1 + 0`.
+    # argument order is part of the key, since optimizing can drop variables.
+    return tuple(classifyVars(expression)), tuple(
+            ("var", item.name) if isinstance(item, variable) else
+            ("op", item.name) if isinstance(item, operator) else
+            float(item)
+            for item in optimizePostfix(expression)
+            )
+
+def serializePostfix(expression):
+    # plain lists and numbers, for json and marshal: variables become ["var", name] and operators ["op", name]
+    return [
+            ["var", item.name] if isinstance(item, variable) else
+            ["op", item.name] if isinstance(item, operator) else
+            float(item)
+            for item in expression
+            ]
+
+def deserializePostfix(items):
+    return mystack(
+            variable(item[1]) if isinstance(item, (list, tuple)) and item[0] == "var" else
+            operator(item[1]) if isinstance(item, (list, tuple)) else
+            float(item)
+            for item in items
+            )
+
+def deserializeKey(key):
+    # a normalized form read back from json, where its tuples became lists
+    names, items = key
+    return tuple(names), tuple(tuple(item) if isinstance(item, list) else item for item in items)
+
+def getVersion():
+    # changes with this file and with python's bytecode, either of which makes stored compilations unusable
+    with open(__file__, "rb") as file:
+        return hashlib.sha256(importlib.util.MAGIC_NUMBER + file.read()).hexdigest()
+
+class compiledStore:
+    # compiled expressions kept on disk between runs, by normalized form, as marshalled code objects.
+    # the file is read whole but entries are only decoded when asked for; a store written by another version
+    # of this file or of python is ignored and replaced on the next save.
+    maxEntries = 4096
+
+    def __init__(self, path, maxEntries=None):
+        self.path = path
+        self.maxEntries = maxEntries or self.maxEntries
+        self.version = getVersion()
+        self.entries = {} # normalized form: marshalled (postfix, scalar code and source, array code and source)
+        self.changed = False
+        try:
+            with open(path, "rb") as file:
+                saved = marshal.load(file)
+            if saved["version"] == self.version:
+                self.entries = saved["entries"]
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            pass # no store yet, or an unreadable one; it is rewritten on save
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        data = self.entries.pop(key, None)
+        if data is None:
+            return None
+        self.entries[key] = data # most recently used last, so the oldest go first when trimming
+        items, (code, source), (arrayCode, arraySource) = marshal.loads(data)
+        return compiledExpression(deserializePostfix(items), compiler.load(code, source), arrayCompiler.load(arrayCode, arraySource))
+
+    def add(self, key, compiled):
+        self.entries[key] = marshal.dumps((serializePostfix(compiled.postfix),
+                (compiled.call.__code__, compiled.call.source), (compiled.callArray.__code__, compiled.callArray.source)))
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        while len(self.entries) > self.maxEntries:
+            del self.entries[next(iter(self.entries))]
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as file:
+            marshal.dump({"version": self.version, "entries": self.entries}, file)
+        os.replace(temporary, self.path)
+        self.changed = False
+
+class expressionCache:
+    # compiled expressions by normalized form, plus the raw strings already seen, both least-recently-used first.
+    # shared by the render thread and the command channel, hence the lock. misses are looked up in `store`,
+    # a compiledStore, before compiling, when there is one.
+    def __init__(self, maxSize=256, store=None):
+        self.maxSize = maxSize
+        self.store = store
+        self.lock = threading.Lock()
+        self.strings = OrderedDict() # string: normalized form
+        self.entries = OrderedDict() # normalized form: compiledExpression
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self.lock:
+            self.strings.clear()
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+                "maxSize": self.maxSize
+                }
+
+    def get(self, string):
+        with self.lock:
+            return self.lookup(string)
+
+    def lookup(self, string):
+        key = self.strings.get(string)
+        if key is None or key not in self.entries:
+            expression = infixToPostfix(strToInfix(string))
+            key = normalizeExpression(expression)
+        self.strings[string] = key
+        self.strings.move_to_end(string)
+        while len(self.strings) > 4 * self.maxSize:
+            self.strings.popitem(last=False)
+        return self.fetch(key, lambda: expression)
+
+    def getPostfix(self, expression, key=None):
+        # like get, for an expression that is already parsed. `key` is its normalized form if known, e.g. saved
+        # alongside it; with a store, a known key is looked up without parsing, optimizing or compiling anything
+        with self.lock:
+            return self.fetch(key or normalizeExpression(expression), lambda: expression)
+
+    def fetch(self, key, expression):
+        # `expression` returns the postfix to compile, only called when nothing has it compiled already
+        compiled = self.entries.get(key)
+        if compiled is None:
+            self.misses += 1
+            compiled = self.store.get(key) if self.store is not None else None
+            if compiled is None:
+                compiled = compileExpression(expression())
+                if self.store is not None:
+                    self.store.add(key, compiled)
+            self.entries[key] = compiled
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return compiled
+
+cache = expressionCache()
+
+def getExpression(string):
+    return cache.get(string)
+
 def getFunc(string):
-    expression = strToInfix(string)
-    postfix = infixToPostfix(expression)
-    return getFunctionFromPostfix(postfix)
+    return getExpression(string).call
 
 def calculateStr(string):
-    expression = strToInfix(string)
-    postfix = infixToPostfix(expression)
-    return calculatePostfix(postfix)
+    compiled = getExpression(string)
+    try:
+        return compiled.call()
+    except TypeError:
+        # a free variable leaves the compiled function short of arguments; the interpreter says so properly
+        return calculatePostfix(compiled.postfix)
 
 def main():
     test_expressions = [
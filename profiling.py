@@ -0,0 +1,115 @@
+import json
+import time
+import threading
+import contextlib
+from collections import deque
+import numpy
+import pygame
+import labels
+
+# upper edges of the histogram buckets, in milliseconds
+bucketEdges = (0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, float("inf"))
+
+def getBucketName(index):
+    if bucketEdges[index] == float("inf"):
+        return f">={bucketEdges[index - 1]}ms"
+    return f"<{bucketEdges[index]}ms"
+
+def timed(profiler, name):
+    # times the block under `name`, or does nothing when there is no profiler
+    return contextlib.nullcontext() if profiler is None else profiler.time(name)
+
+class profiler:
+    # rolling frame-time windows per named stage, plus counters set by whoever owns them.
+    # stages may be timed from several threads at once, e.g. tiles rendered in the background.
+    window = 240
+
+    def __init__(self, window=None, dumpPath=None, dumpInterval=10):
+        self.window = window or self.window
+        self.dumpPath = dumpPath
+        self.dumpInterval = dumpInterval
+        self.lastDump = time.monotonic()
+        self.lock = threading.Lock()
+        self.stages = {} # name: deque of seconds
+        self.totals = {} # name: times recorded since the start
+        self.counters = {} # name: value, or a dict of values
+        self.labels = labels.labeler()
+
+    def record(self, name, seconds):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = deque(maxlen=self.window)
+                self.totals[name] = 0
+            self.stages[name].append(seconds)
+            self.totals[name] += 1
+
+    @contextlib.contextmanager
+    def time(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - begin)
+
+    def clear(self):
+        with self.lock:
+            self.stages.clear()
+            self.totals.clear()
+
+    def getStage(self, name):
+        with self.lock:
+            times = numpy.array(self.stages[name]) * 1000
+            count = self.totals[name]
+        counts = numpy.histogram(times, (0,) + bucketEdges)[0]
+        return {
+                "count": count,
+                "mean ms": float(times.mean()),
+                "p50 ms": float(numpy.percentile(times, 50)),
+                "p95 ms": float(numpy.percentile(times, 95)),
+                "max ms": float(times.max()),
+                "histogram": {getBucketName(index): int(n) for index, n in enumerate(counts)}
+                }
+
+    def stats(self):
+        with self.lock:
+            names = sorted(self.stages)
+        return {"stages": {name: self.getStage(name) for name in names}, "counters": dict(self.counters)}
+
+    def dump(self, path=None):
+        with open(path or self.dumpPath, "w") as file:
+            json.dump(self.stats(), file, indent=4)
+
+    def maybeDump(self):
+        # dumps to `dumpPath` every `dumpInterval` seconds; call once per frame
+        if self.dumpPath is not None and time.monotonic() - self.lastDump >= self.dumpInterval:
+            self.lastDump = time.monotonic()
+            self.dump()
+
+    def drawOverlay(self, surface, size=12):
+        # mean, p95 and max per stage with a histogram of the window, in a panel in the top left corner
+        font, height = self.labels.getFont(size)
+        lineHeight = height + 4
+        stats = self.stats()
+        rows = [("stage", "mean", "p95", "max", None)]
+        for name, stage in stats["stages"].items():
+            rows.append((name[:32], f"{stage['mean ms']:.2f}", f"{stage['p95 ms']:.2f}", f"{stage['max ms']:.2f}",
+                    list(stage["histogram"].values())))
+        for name, value in stats["counters"].items():
+            values = value.items() if isinstance(value, dict) else [("", value)]
+            for key, number in values:
+                rows.append((f"{name} {key}"[:32], f"{number:,}", "", "", None))
+        columns = (0, 24 * size, 28 * size, 32 * size, 36 * size)
+        barWidth = 4
+        panel = pygame.Surface((columns[-1] + len(bucketEdges) * barWidth + 8, len(rows) * lineHeight + 8), pygame.SRCALPHA)
+        panel.fill((255, 255, 255, 200))
+        for row, values in enumerate(rows):
+            y = 4 + row * lineHeight
+            for column, text in zip(columns, values[:4]):
+                if text:
+                    font.render_to(panel, (4 + column, y), text, (0, 0, 0))
+            if values[4]:
+                most = max(values[4])
+                for index, count in enumerate(values[4]):
+                    bar = round(height * count / most)
+                    panel.fill((200, 0, 0), (4 + columns[-1] + index * barWidth, y + height - bar, barWidth - 1, bar))
+        surface.blit(panel, (0, 0))
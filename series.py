@@ -0,0 +1,111 @@
+import os
+import math
+import zipfile
+import numpy
+import grid
+
+# recorded data plotted alongside expressions. samples stay memory-mapped on disk; a pyramid of per-block minima
+# and maxima is kept in memory, so a frame reads about as many values as there are pixel columns whatever the file size.
+
+def buildPyramid(ys, leafBlock=64, factor=4, chunk=1 << 22):
+    # [(block size, minima, maxima)] from `leafBlock` samples per block up, `factor` times coarser each level.
+    # the first level is reduced chunk by chunk, so the samples are streamed through once and never loaded whole.
+    chunk -= chunk % leafBlock
+    minima, maxima = [], []
+    for start in range(0, len(ys), chunk):
+        values = numpy.asarray(ys[start:start + chunk])
+        offsets = numpy.arange(0, len(values), leafBlock)
+        minima.append(numpy.fmin.reduceat(values, offsets))
+        maxima.append(numpy.fmax.reduceat(values, offsets))
+    empty = numpy.empty(0, dtype=ys.dtype)
+    levels = [(leafBlock, numpy.concatenate(minima or [empty]), numpy.concatenate(maxima or [empty]))]
+    while len(levels[-1][1]) > factor:
+        block, lows, highs = levels[-1]
+        offsets = numpy.arange(0, len(lows), factor)
+        levels.append((block * factor, numpy.fmin.reduceat(lows, offsets), numpy.fmax.reduceat(highs, offsets)))
+    return levels
+
+def loadPyramid(path, ys, leafBlock=64):
+    # the pyramid saved next to the data, rebuilt when missing, older than the data, or made for other samples:
+    # a raw file read as another dtype, or the y column of a different layout
+    pyramidPath = path + ".pyramid.npz"
+    if os.path.exists(pyramidPath) and os.path.getmtime(pyramidPath) >= os.path.getmtime(path):
+        try:
+            with numpy.load(pyramidPath) as saved:
+                blocks = saved["blocks"]
+                if (str(saved["dtype"]) == ys.dtype.str and int(saved["length"]) == len(ys)
+                        and len(blocks) and int(blocks[0]) == leafBlock):
+                    return [(int(block), saved[f"minima{index}"], saved[f"maxima{index}"])
+                            for index, block in enumerate(blocks)]
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            pass # unreadable, or saved before it recorded what it was made from
+    levels = buildPyramid(ys, leafBlock)
+    arrays = {"blocks": numpy.array([block for block, _, _ in levels]), "dtype": ys.dtype.str, "length": len(ys)}
+    for index, (_, lows, highs) in enumerate(levels):
+        arrays[f"minima{index}"] = lows
+        arrays[f"maxima{index}"] = highs
+    try:
+        with open(pyramidPath, "wb") as file:
+            numpy.savez(file, **arrays)
+    except OSError:
+        pass # read-only data still plots; the pyramid is just rebuilt next time
+    return levels
+
+class dataSeries:
+    # y values at x = x0 + i * dx, or (x, y) rows sorted by x, from a raw binary file of `dtype` or an .npy file
+    kind = "series"
+    def __init__(self, path, dtype=numpy.float64, x0=0, dx=1, settings=None, name=None):
+        if path.endswith(".npy"):
+            data = numpy.load(path, mmap_mode="r")
+        else:
+            data = numpy.memmap(path, dtype=dtype, mode="r")
+        if data.ndim == 2 and data.shape[1] == 2:
+            self.xs, self.ys = data[:, 0], data[:, 1]
+        elif data.ndim == 1:
+            self.xs, self.ys = None, data
+        else:
+            raise ValueError(f"a series should be one column of y values or two of x and y; got shape {data.shape}")
+        self.path = path
+        self.x0, self.dx = x0, dx
+        self.name = name or os.path.basename(path)
+        self.revision = next(grid.revisions)
+        self.evaluations = 0 # values read so far
+        self.levels = loadPyramid(path, self.ys)
+        self.settings = settings or grid.funcSettings()
+
+    def getIndex(self, x):
+        # index of the first sample at or after x
+        if self.xs is None:
+            return min(max(math.ceil((x - self.x0) / self.dx), 0), len(self.ys))
+        return int(numpy.searchsorted(self.xs, x))
+
+    def getX(self, indices):
+        if self.xs is None:
+            return self.x0 + numpy.asarray(indices, dtype=float) * self.dx
+        return numpy.asarray(self.xs[numpy.minimum(indices, len(self.xs) - 1)], dtype=float)
+
+    def sample(self, left, right, columns):
+        # (xs, ys) to draw [left, right] across `columns` pixels: the samples themselves when there are few enough,
+        # otherwise each column's minimum and maximum, from the coarsest pyramid level with a block or more per column,
+        # or from the samples while columns are narrower than the finest level's blocks
+        start = max(self.getIndex(left) - 1, 0)
+        stop = min(self.getIndex(right) + 1, len(self.ys))
+        if stop - start <= 2 * columns:
+            self.evaluations += stop - start
+            return self.getX(numpy.arange(start, stop)), numpy.asarray(self.ys[start:stop], dtype=float)
+        perColumn = (stop - start) / columns
+        block, lows, highs = 1, self.ys, self.ys
+        for level in self.levels:
+            if level[0] <= perColumn:
+                block, lows, highs = level
+        first, last = start // block, min(-(-stop // block), len(lows))
+        edges = numpy.unique(first + numpy.round(numpy.arange(columns + 1) * (last - first) / columns).astype(int))
+        self.evaluations += (last - first) * (1 if block == 1 else 2)
+        columnLows = numpy.fmin.reduceat(numpy.asarray(lows[first:last], dtype=float), edges[:-1] - first)
+        columnHighs = numpy.fmax.reduceat(numpy.asarray(highs[first:last], dtype=float), edges[:-1] - first)
+        # both extremes at the middle of each column, so the line sweeps the whole range the column covers
+        centres = self.getX((edges[:-1] + edges[1:]) * block // 2)
+        return numpy.repeat(centres, 2), numpy.column_stack((columnLows, columnHighs)).ravel()
+
+    def countEvaluations(self):
+        return self.evaluations
@@ -0,0 +1,102 @@
+import os
+import json
+import dataclasses
+import postfix
+import grid
+
+# the curves of a viewer, kept between runs: a small json file of expressions and their funcSettings, and next to it
+# a compiledStore of their compiled forms, so a restart parses and compiles nothing it has seen before.
+# expressions are stored as postfix rather than text, and plain functions with their normalized form too, which
+# is trusted only while the store's version matches.
+
+formatVersion = 1
+
+def getStorePath(path):
+    return path + ".compiled"
+
+def openStore(path):
+    # compiled expressions for the session at `path`, used by every later compile in this process
+    postfix.cache.store = postfix.compiledStore(getStorePath(path))
+    return postfix.cache.store
+
+def saveFunction(f):
+    # the json entry for one curve, or None for kinds that cannot be saved
+    entry = {"kind": f.kind, "name": f.name, "settings": dataclasses.asdict(f.settings)}
+    if f.kind == "function":
+        entry["expression"] = postfix.serializePostfix(f.expression)
+        entry["key"] = postfix.normalizeExpression(f.expression)
+    elif f.kind == "parametric":
+        entry["expressions"] = [postfix.serializePostfix(expression) for expression in f.expressions]
+        entry["tRange"] = f.tRange
+        entry["samples"] = f.samples
+    elif f.kind == "implicit":
+        entry["expression"] = postfix.serializePostfix(f.expression)
+    elif f.kind == "series":
+        entry.update(path=os.path.abspath(f.path), dtype=str(f.ys.dtype), x0=f.x0, dx=f.dx)
+    else:
+        return None
+    return entry
+
+def loadSettings(saved):
+    # funcSettings from its saved fields; fields this version does not know are dropped
+    names = {field.name for field in dataclasses.fields(grid.funcSettings)}
+    return grid.funcSettings(**{name: tuple(value) if isinstance(value, list) else value
+            for name, value in saved.items() if name in names})
+
+def loadFunction(entry, version):
+    settings = loadSettings(entry["settings"])
+    kind = entry["kind"]
+    if kind == "function":
+        expression = postfix.deserializePostfix(entry["expression"])
+        key = postfix.deserializeKey(entry["key"]) if version == postfix.cache.store.version else None
+        compiled = postfix.cache.getPostfix(expression, key)
+        return grid.function(expression, settings, compiled, entry["name"])
+    if kind == "parametric":
+        expressions = [postfix.deserializePostfix(expression) for expression in entry["expressions"]]
+        return grid.parametric(*expressions, tuple(entry["tRange"]), entry["samples"], settings, entry["name"])
+    if kind == "implicit":
+        return grid.implicit(postfix.deserializePostfix(entry["expression"]), settings, entry["name"])
+    if kind == "series":
+        import series # numpy memory maps and pyramids are only needed by sessions that have recorded data
+        return series.dataSeries(entry["path"], entry["dtype"], entry["x0"], entry["dx"], settings, entry["name"])
+    raise ValueError(f"unknown kind of curve `{kind}`")
+
+def saveSession(g, path):
+    store = postfix.cache.store
+    session = {
+            "format": formatVersion,
+            "version": store.version if store is not None else None,
+            "functions": [entry for entry in map(saveFunction, g.functions) if entry is not None]
+            }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        file.write(json.dumps(session, separators=(",", ":")))
+    os.replace(temporary, path)
+    if store is not None:
+        store.save()
+
+def loadSession(g, path):
+    # adds the curves saved at `path` to `g` and returns how many; curves that no longer load are skipped with a
+    # message. the store is opened first, so it serves these curves and everything compiled after them
+    if postfix.cache.store is None:
+        openStore(path)
+    try:
+        with open(path) as file:
+            session = json.load(file)
+    except FileNotFoundError:
+        return 0
+    except ValueError as error:
+        print(f"ignoring {path}: {error}")
+        return 0
+    if session.get("format") != formatVersion:
+        print(f"ignoring {path}: session format {session.get('format')}, expected {formatVersion}")
+        return 0
+    added = 0
+    for entry in session["functions"]:
+        try:
+            g.addFunc(loadFunction(entry, session["version"]))
+            added += 1
+        except (ValueError, KeyError, TypeError, OSError) as error:
+            print(f"skipping `{entry.get('name')}` from {path}: {error}")
+    return added
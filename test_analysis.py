@@ -0,0 +1,74 @@
+import threading
+import numpy
+import pytest
+import analysis
+import grid
+import postfix
+
+def curve(string):
+    return grid.function(postfix.getExpression(string).postfix, name=string)
+
+def find(*strings, view=(-10, 10), columns=800):
+    functions = [curve(string) for string in strings]
+    return analysis.analyzer().analyze(functions, *view, columns, (view[1] - view[0]) / columns)
+
+def points(results, name):
+    xs, ys, first, second = results[name]
+    order = numpy.argsort(xs)
+    return xs[order], ys[order], first[order], second[order]
+
+def testRoots():
+    xs, ys, owners, _ = points(find("x^2 - 4", "x - 3"), "roots")
+    numpy.testing.assert_allclose(xs, [-2, 2, 3], atol=1e-9)
+    numpy.testing.assert_array_equal(ys, 0)
+    numpy.testing.assert_array_equal(owners, [0, 0, 1])
+
+def testDoubleRootIsFoundFromItsExtremum():
+    # (x-1)^2 only touches zero, so there is no sign change to bracket
+    xs, _, _, _ = points(find("(x - 1)^2"), "roots")
+    numpy.testing.assert_allclose(xs, [1], atol=1e-6)
+
+def testExtrema():
+    results = find("x^3 - 3x")
+    minima, maxima = points(results, "minima"), points(results, "maxima")
+    numpy.testing.assert_allclose(minima[0], [1], atol=1e-9)
+    numpy.testing.assert_allclose(minima[1], [-2], atol=1e-9)
+    numpy.testing.assert_allclose(maxima[0], [-1], atol=1e-9)
+    numpy.testing.assert_allclose(maxima[1], [2], atol=1e-9)
+
+def testIntersections():
+    xs, ys, first, second = points(find("x^2/4", "x + 3", "5"), "intersections")
+    # x^2/4 = x + 3 at -2 and 6, x^2/4 = 5 at -sqrt(20) and sqrt(20), x + 3 = 5 at 2
+    numpy.testing.assert_allclose(xs, [-20 ** 0.5, -2, 2, 20 ** 0.5, 6], atol=1e-9)
+    numpy.testing.assert_allclose(ys, [5, 1, 5, 5, 9], atol=1e-9)
+    assert list(zip(first.tolist(), second.tolist())) == [(0, 2), (0, 1), (1, 2), (0, 2), (0, 1)]
+
+def testPolesAreNotRoots():
+    # 1/x changes sign across its pole without ever being near zero there
+    results = find("1/x", "1/(x - 2) + 1")
+    xs, _, owners, _ = points(results, "roots")
+    numpy.testing.assert_allclose(xs, [1], atol=1e-9)
+    numpy.testing.assert_array_equal(owners, [1])
+    # their difference changes sign at both poles, but the curves never meet
+    assert len(results["intersections"][0]) == 0
+
+def testOnlyWhatIsInView():
+    xs, _, _, _ = points(find("x^2 - 4", view=(0, 10)), "roots")
+    numpy.testing.assert_allclose(xs, [2], atol=1e-9)
+
+def testSearchOffTheRenderThread():
+    # with `run`, the view is searched by the job it is given, and the caller gets no results until it is done
+    jobs = []
+    finder = analysis.analyzer()
+    functions = [curve("x^2 - 4")]
+    pending = finder.analyze(functions, -10, 10, 800, 0.025, run=jobs.append)
+    assert len(pending["roots"][0]) == 0 and pending["version"] == 0
+    # asked again before it starts: still one job
+    finder.analyze(functions, -10, 10, 800, 0.025, run=jobs.append)
+    assert len(jobs) == 1
+    worker = threading.Thread(target=jobs[0])
+    worker.start()
+    worker.join()
+    found = finder.analyze(functions, -10, 10, 800, 0.025, run=jobs.append)
+    numpy.testing.assert_allclose(numpy.sort(found["roots"][0]), [-2, 2], atol=1e-9)
+    assert found["version"] > 0 and len(jobs) == 1
@@ -0,0 +1,83 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import pytest
+import commands
+import grid
+
+@pytest.fixture(autouse=True)
+def events():
+    # receive wakes the main loop through the event queue
+    pygame.display.init()
+    yield
+    pygame.display.quit()
+
+def testParseStyle():
+    assert commands.parseStyle(["color=255,0,10", "width=3", "type=dotted", "visible=0"]) == {
+            "lineColor": (255, 0, 10), "lineWidth": 3, "lineType": grid.linetype.dotted, "visible": False}
+    assert commands.parseStyle(["visible=1"]) == {"visible": True}
+    assert commands.parseStyle([]) == {}
+
+@pytest.mark.parametrize("words, message", [
+    (["colour=1,2,3"], "unknown style `colour`"),
+    (["color=1,2"], "color should be R,G,B"),
+    (["color=0,0,256"], "color should be R,G,B"),
+    (["type=dashed"], "type should be solid, dotted or squiggly"),
+    (["width=thick"], "invalid literal"),
+])
+def testParseStyleErrors(words, message):
+    with pytest.raises(ValueError, match=message):
+        commands.parseStyle(words)
+
+def testParseCommand():
+    action, name, compiled = commands.parseCommand("add f = x^2 - 1")
+    assert (action, name) == ("set", "f") and compiled.call(3) == 8
+    assert commands.parseCommand("update f=2x")[:2] == ("set", "f")
+    assert commands.parseCommand("  remove f ") == ("remove", "f", None)
+    assert commands.parseCommand("style f color=0,0,255 width=4") == (
+            "style", "f", {"lineColor": (0, 0, 255), "lineWidth": 4})
+    assert commands.parseCommand("clear") == ("clear", None, None)
+    # anything else is an equation, named by its own text
+    action, name, compiled = commands.parseCommand("x/2 + 1")
+    assert (action, name, compiled.call(4)) == ("set", "x/2 + 1", 3)
+    assert commands.parseCommand("") is None
+    assert commands.parseCommand("# a comment") is None
+
+@pytest.mark.parametrize("line, message", [
+    ("add f x^2", "expected `add NAME = EXPRESSION`"),
+    ("add = x", "expected `add NAME = EXPRESSION`"),
+    ("remove", "expected `remove NAME`"),
+    ("style", "expected `style NAME key=value ...`"),
+    ("style f colour=1,2,3", "unknown style `colour`"),
+    ("delete f", "unknown command `delete`"),
+    ("add f = x + y", "at most one variable"),
+    ("add f = x + * 2", "missing operand before `*`"),
+])
+def testParseCommandErrors(line, message):
+    with pytest.raises(ValueError, match=message):
+        commands.parseCommand(line)
+
+def testUnknownNamesAreReported():
+    channel = commands.commandChannel(stdin=False)
+    replies = []
+    channel.receive(["remove f", "style f width=3", "add f = x", "style f width=3", "remove f", "remove f"],
+            replies.append)
+    # f only exists between its add and the first remove, counting what is still queued
+    assert replies == ["error: no curve named `f`"] * 3
+    g = grid.grid()
+    assert channel.apply(g) == 3
+    assert g.functions == [] and channel.curves == {}
+
+def testBadLinesDoNotStopTheBatch():
+    channel = commands.commandChannel(stdin=False)
+    replies = []
+    channel.receive(["add f = x^2", "add g = (x", "style f color=0,255,0"], replies.append)
+    assert len(replies) == 1 and replies[0].startswith("error: unclosed `(`")
+    g = grid.grid()
+    assert channel.apply(g) == 2
+    assert [f.name for f in g.functions] == ["f"] and g.functions[0].settings.lineColor == (0, 255, 0)
+    # curves applied on an earlier frame can be named too
+    channel.receive(["style f width=5", "remove h"], replies.append)
+    assert replies[-1] == "error: no curve named `h`"
+    channel.apply(g)
+    assert g.functions[0].settings.lineWidth == 5
@@ -0,0 +1,22 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pytest
+import grid
+import tiles
+
+@pytest.mark.parametrize("view", [(5, 5, 1e-9, 1e-9), (0, 0, 0.001, 0.001), (-4e9, -4e9, 8e9, 8e9)])
+def testAnyZoomRenders(view):
+    # labels scale with the world, but only up to a size freetype can render
+    g = grid.grid()
+    g.addFuncFromString("x")
+    g.render(view, (800, 800))
+    tiles.tileCache(g, prefetch=False).render(view, (800, 800))
+    assert 1 <= g.getLabelSize(grid.projection(view, (800, 800))) <= g.labels.maxSize
+
+def testLabelSize():
+    g = grid.grid()
+    assert g.getLabelSize(grid.projection((0, 0, 800, 800), (800, 800))) == g.settings.labelScale
+    assert g.getLabelSize(grid.projection((0, 0, 8, 8), (800, 800))) == g.labels.maxSize
+    assert g.getLabelSize(grid.projection((0, 0, 8e6, 8e6), (800, 800))) == 1
+    g.settings.pixelSizes = True
+    assert g.getLabelSize(grid.projection((0, 0, 8, 8), (800, 800))) == g.settings.labelScale
@@ -0,0 +1,224 @@
+import math
+import numpy
+import pytest
+import postfix
+
+# the optimizing pass (folding, identities, ^2 and common subexpressions) must never change a result,
+# on either backend, including where the result is undefined.
+
+def parse(string):
+    return postfix.infixToPostfix(postfix.strToInfix(string))
+
+def show(expression):
+    return " ".join(map(str, expression))
+
+def generateSum(terms):
+    # a long machine-generated sum, as in bench.generateExpression
+    return " + ".join(f"{(index % 9) + 1}.5x^{index % 4} - (x + {index})/{index + 1}" for index in range(terms))
+
+equivalentExpressions = [
+    "x^3",
+    "(1/9x)^2",
+    "2x + 10",
+    "(x^2)/100 - (3x) + 4",
+    "(x+1)*(x+1)",
+    "(x+1)*(x+1) + (x+1)^2 * 1 + 0",
+    "((2x)^2 - (2x)^2/2)^1 / 1",
+    "-(-(x^2 + 3/x))",
+    "1/(x - 2) + 0 * x",
+    "x^-1 * 1",
+    "(x - 3)^0.5",
+    generateSum(20),
+]
+
+@pytest.mark.parametrize("string", equivalentExpressions)
+def testArrayEquivalence(string):
+    xs = numpy.linspace(-10, 10, 401)
+    expression = parse(string)
+    literal = postfix.compilePostfixArray(expression, optimize=False)(xs)
+    optimized = postfix.compilePostfixArray(expression)(xs)
+    numpy.testing.assert_allclose(optimized, literal, rtol=1e-12, equal_nan=True)
+
+@pytest.mark.parametrize("string", equivalentExpressions)
+def testScalarEquivalence(string):
+    expression = parse(string)
+    interpreted = postfix.getFunctionFromPostfix(expression)
+    literal = postfix.compilePostfix(expression, optimize=False)
+    optimized = postfix.compilePostfix(expression)
+    for x in numpy.linspace(-10, 10, 41).tolist():
+        try:
+            expected = interpreted(x)
+        except ArithmeticError as error:
+            # a domain error raises the same way whether or not the expression was optimized
+            for f in (literal, optimized):
+                with pytest.raises(type(error)):
+                    f(x)
+            continue
+        assert literal(x) == pytest.approx(expected, rel=1e-12)
+        assert optimized(x) == pytest.approx(expected, rel=1e-12)
+
+def testFolding():
+    assert show(postfix.optimizePostfix(parse("2 * 3 + 4^2"))) == "22.0"
+    assert show(postfix.optimizePostfix(parse("x * (2 + 3)"))) == "x 5.0 mul"
+    assert postfix.calculateStr("2 * 3 + 4^2") == 22
+
+@pytest.mark.parametrize("string", ["2^0.5 * 3", "(0-1)^0.5", "1/0", "0^-1", "10^400", "x + 1"])
+def testCalculateStrMatchesTheInterpreter(string):
+    # calculateStr runs the cached compiled function, but answers and fails as the interpreter does
+    try:
+        expected = postfix.calculatePostfix(parse(string))
+    except (ArithmeticError, ValueError) as error:
+        with pytest.raises(type(error)):
+            postfix.calculateStr(string)
+    else:
+        assert postfix.calculateStr(string) == pytest.approx(expected, rel=1e-12)
+
+def testFoldingLeavesErrorsForCallTime():
+    # 1/0 is not folded away; it raises when called, as the interpreter does, and is nan over arrays
+    expression = parse("x + 1/0")
+    assert show(postfix.optimizePostfix(expression)) == "x 1.0 0.0 truediv add"
+    with pytest.raises(ZeroDivisionError):
+        postfix.compilePostfix(expression)(1)
+    assert numpy.isnan(postfix.compilePostfixArray(expression)(numpy.array([1.0, 2.0]))).all()
+
+@pytest.mark.parametrize("string, expected", [
+    ("x + 0", "x"),
+    ("0 + x", "x"),
+    ("x - 0", "x"),
+    ("0 - x", "x neg"),
+    ("x * 1", "x"),
+    ("1 * x", "x"),
+    ("x * -1", "x neg"),
+    ("x / 1", "x"),
+    ("x ^ 1", "x"),
+    ("x ^ 0", "1.0"),
+    ("-(-x)", "x"),
+])
+def testIdentities(string, expected):
+    assert show(postfix.optimizePostfix(parse(string))) == expected
+
+def testSquareBecomesProduct():
+    assert show(postfix.optimizePostfix(parse("(x+1)^2"))) == "x 1.0 add x 1.0 add mul"
+    # and the repeated operand is computed once
+    assert postfix.countOperations(postfix.optimizePostfix(parse("(x+1)^2"))) == 2
+
+def testCommonSubexpressions():
+    assert postfix.countOperations(parse("(x+1)*(x+1)")) == 2
+    assert postfix.countOperations(parse("(x+1)*(x+1) + (x+1)")) == 3
+    assert postfix.countOperations(parse("x*y + y*x")) == 3 # operand order is kept, so these differ
+
+def testVariablesKeepTheirPositions():
+    # optimizing drops y, but the compiled function still takes (x, y)
+    f = postfix.compilePostfix(parse("x + 0*y"))
+    assert f(3, 100) == 3
+    g = postfix.compilePostfixArray(parse("0*x + y"))
+    numpy.testing.assert_array_equal(g(numpy.zeros(3), numpy.arange(3.0)), [0, 1, 2])
+
+@pytest.mark.parametrize("string, x", [
+    ("1/x", 0.0),
+    ("x^-1", 0.0),
+    ("(x - 3)^0.5", 1.0),
+    ("1/(x - x)", 2.0),
+])
+def testDomainErrors(string, x):
+    # nan over arrays, and whatever the interpreter does for scalars
+    expression = parse(string)
+    assert numpy.isnan(postfix.compilePostfixArray(expression)(numpy.array([x])))[0]
+    try:
+        expected = postfix.getFunctionFromPostfix(expression)(x)
+    except ArithmeticError as error:
+        with pytest.raises(type(error)):
+            postfix.compilePostfix(expression)(x)
+    else:
+        result = postfix.compilePostfix(expression)(x)
+        assert result == expected or (isinstance(result, float) and math.isnan(result))
+
+def testNanPropagates():
+    f = postfix.compilePostfixArray(parse("x * 0 + 1"))
+    # x * 0 is not folded to 0, so a nan argument stays nan
+    assert numpy.isnan(f(numpy.array([numpy.nan])))[0]
+
+def testLongExpressionsOptimize():
+    # simplifying is iterative, so thousands of terms do not hit the recursion limit
+    expression = parse(generateSum(1200))
+    optimized = postfix.optimizePostfix(expression)
+    assert 0 < len(optimized) < len(expression)
+    derivative = postfix.differentiatePostfix(expression, "x")
+    assert len(derivative) > 0
+
+@pytest.mark.parametrize("string", [
+    "x" + "+x" * 250,
+    "+".join(f"{index}x^2" for index in range(400)),
+    generateSum(1000),
+])
+def testLongExpressionsCompile(string):
+    # far more operations than python will nest in one line; the generated code stays shallow
+    expression = parse(string)
+    interpreted = postfix.getFunctionFromPostfix(expression)(1.5)
+    compiled = postfix.compileExpression(expression)
+    assert compiled.call(1.5) == pytest.approx(interpreted, rel=1e-9)
+    assert compiled.callArray(numpy.array([1.5]))[0] == pytest.approx(interpreted, rel=1e-9)
+
+def testDerivatives():
+    xs = numpy.linspace(-5, 5, 101) + 0.05
+    for string in ("x^3 - 2x/(x+1)", "-(x^2)*3", "(x+1)^2/x", "4"):
+        expression = parse(string)
+        f = postfix.compilePostfixBatch(expression, ("x",))
+        derivative = postfix.compilePostfixBatch(postfix.differentiatePostfix(expression, "x"), ("x",))
+        step = 1e-6
+        numpy.testing.assert_allclose(derivative(xs), (f(xs + step) - f(xs - step)) / (2 * step), rtol=1e-4, atol=1e-4)
+    with pytest.raises(ValueError):
+        postfix.differentiatePostfix(parse("x^x"), "x")
+
+def testTokenStream():
+    # numbers, names and operators with the positions they were read from, wrapped in parentheses
+    tokens = postfix.strToInfix("12.5x div (y - .5)")
+    assert show(tokens) == "( 12.5 x truediv ( y sub 0.5 ) )"
+    assert [getattr(token, "position", None) for token in tokens] == [None, 0, 4, 6, 10, 11, 13, 15, 17, None]
+    assert isinstance(tokens[1], postfix.number) and isinstance(tokens[2], postfix.variable)
+
+@pytest.mark.parametrize("string, expected", [
+    ("2x", "2.0 x mul"),
+    ("2x^2", "2.0 x 2.0 pow mul"),
+    ("1/9x", "1.0 9.0 truediv x mul"),
+    ("2(x+1)", "2.0 x 1.0 add mul"),
+    ("x(x+1)", "x x 1.0 add mul"),
+    ("(x+1)(x-1)", "x 1.0 add x 1.0 sub mul"),
+    ("3 4", "3.0 4.0 mul"),
+    ("x y", "x y mul"),
+])
+def testImplicitMultiplication(string, expected):
+    # between any operand or `)` and a following operand or `(`
+    assert show(parse(string)) == expected
+
+@pytest.mark.parametrize("string, expected", [
+    ("-x", "x neg"),
+    ("-x^2", "x neg 2.0 pow"),
+    ("2*-x", "2.0 x neg mul"),
+    ("2--x", "2.0 x neg sub"),
+    ("x*-2^2", "x 2.0 neg 2.0 pow mul"),
+    ("(x+1) - 2", "x 1.0 add 2.0 sub"),
+])
+def testNegation(string, expected):
+    # `-` is negation wherever no operand comes before it, and binds tighter than `^`
+    assert show(parse(string)) == expected
+
+@pytest.mark.parametrize("string, message, position", [
+    ("x + * 2", "missing operand before `*`", 4),
+    ("x ** 2", "missing operand before `*`", 3),
+    ("(x+)", "missing operand before `)`", 3),
+    ("()", "missing operand before `)`", 1),
+    ("x^2 +", "missing operand after `+`", 5),
+    ("-", "missing operand after `-`", 1),
+    ("", "empty expression", 0),
+    ("1.2.3", "malformed number `1.2.3`", 0),
+    ("x + 1..5", "malformed number `1..5`", 4),
+    ("x $ 2", "unexpected character `$`", 2),
+    ("(x + 1", "unclosed `(`", 0),
+    ("x + 1)", "unmatched `)`", 5),
+])
+def testParseErrors(string, message, position):
+    with pytest.raises(postfix.ParseError) as error:
+        postfix.strToInfix(string)
+    assert error.value.position == position
+    assert str(error.value).startswith(f"{message} at position {position}")
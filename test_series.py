@@ -0,0 +1,95 @@
+import os
+import numpy
+import pytest
+import series
+
+def bruteForce(ys, block):
+    # each block's minimum and maximum, one block at a time; nan only where the whole block is
+    blocks = [[y for y in ys[start:start + block] if y == y] for start in range(0, len(ys), block)]
+    return (numpy.array([min(b, default=numpy.nan) for b in blocks]),
+            numpy.array([max(b, default=numpy.nan) for b in blocks]))
+
+@pytest.mark.parametrize("length", [1, 63, 64, 65, 1000, 64 * 4 ** 3 + 5])
+def testPyramidMatchesBruteForce(length):
+    ys = numpy.random.default_rng(length).normal(size=length)
+    ys[1::7] = numpy.nan # nans are skipped, as fmin and fmax do
+    levels = series.buildPyramid(ys, chunk=256)
+    assert [block for block, _, _ in levels] == [64 * 4 ** index for index in range(len(levels))]
+    assert len(levels[-1][1]) <= 4
+    for block, lows, highs in levels:
+        expectedLows, expectedHighs = bruteForce(ys, block)
+        numpy.testing.assert_array_equal(lows, expectedLows)
+        numpy.testing.assert_array_equal(highs, expectedHighs)
+
+def write(path, ys):
+    ys.tofile(path)
+    return numpy.memmap(path, dtype=ys.dtype, mode="r")
+
+def refuseToBuild(monkeypatch):
+    def build(*args, **kwargs):
+        raise AssertionError("the saved pyramid should have been used")
+    monkeypatch.setattr(series, "buildPyramid", build)
+
+def testSavedPyramidIsReloaded(tmp_path, monkeypatch):
+    path = str(tmp_path / "data.bin")
+    ys = write(path, numpy.arange(5000, dtype=numpy.float64))
+    built = series.loadPyramid(path, ys)
+    assert os.path.exists(path + ".pyramid.npz")
+    refuseToBuild(monkeypatch)
+    loaded = series.loadPyramid(path, ys)
+    assert [block for block, _, _ in loaded] == [block for block, _, _ in built]
+    for (_, lows, highs), (_, savedLows, savedHighs) in zip(built, loaded):
+        numpy.testing.assert_array_equal(savedLows, lows)
+        numpy.testing.assert_array_equal(savedHighs, highs)
+
+def testPyramidIsRebuiltForOtherSamples(tmp_path):
+    path = str(tmp_path / "data.bin")
+    ys = write(path, numpy.arange(5000, dtype=numpy.float64))
+    series.loadPyramid(path, ys)
+    # the same bytes read as another dtype
+    levels = series.loadPyramid(path, numpy.memmap(path, dtype=numpy.float32, mode="r"))
+    assert levels[0][1].dtype == numpy.float32
+    # a different length, with the pyramid still no older than the data
+    ys = write(path, numpy.arange(3000, dtype=numpy.float64))
+    later = os.path.getmtime(path) + 10
+    os.utime(path + ".pyramid.npz", (later, later))
+    levels = series.loadPyramid(path, ys)
+    numpy.testing.assert_array_equal(levels[0][2], bruteForce(numpy.asarray(ys), 64)[1])
+    with numpy.load(path + ".pyramid.npz") as saved:
+        assert int(saved["length"]) == 3000
+
+def testPyramidIsRebuiltWhenTheDataIsNewer(tmp_path, monkeypatch):
+    path = str(tmp_path / "data.bin")
+    ys = write(path, numpy.arange(5000, dtype=numpy.float64))
+    series.loadPyramid(path, ys)
+    earlier = os.path.getmtime(path) - 10
+    os.utime(path + ".pyramid.npz", (earlier, earlier))
+    build, rebuilt = series.buildPyramid, []
+    def count(*args, **kwargs):
+        rebuilt.append(args)
+        return build(*args, **kwargs)
+    monkeypatch.setattr(series, "buildPyramid", count)
+    series.loadPyramid(path, ys)
+    assert len(rebuilt) == 1
+
+def testSeriesSamplesMatchTheData(tmp_path):
+    path = str(tmp_path / "data.npy")
+    ys = numpy.sin(numpy.arange(100000) / 100)
+    numpy.save(path, ys)
+    data = series.dataSeries(path)
+    xs, sampled = data.sample(0, len(ys) - 1, 100)
+    # every column sweeps from the lowest to the highest sample it covers
+    assert sampled.min() == ys.min() and sampled.max() == ys.max()
+    assert len(xs) <= 200 and data.countEvaluations() < len(ys) // 10
+
+def testEmptyFile(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        series.dataSeries(str(path))
+
+def testBadShape(tmp_path):
+    path = str(tmp_path / "data.npy")
+    numpy.save(path, numpy.zeros((4, 3)))
+    with pytest.raises(ValueError, match="one column of y values or two of x and y"):
+        series.dataSeries(path)
@@ -0,0 +1,114 @@
+import json
+import marshal
+import numpy
+import pytest
+import grid
+import postfix
+import series
+import session
+
+def parse(string):
+    return postfix.infixToPostfix(postfix.strToInfix(string))
+
+@pytest.fixture(autouse=True)
+def restart(monkeypatch):
+    # every test starts as a new process would, with an empty cache and no store open
+    monkeypatch.setattr(postfix, "cache", postfix.expressionCache())
+
+def restarted(monkeypatch):
+    monkeypatch.setattr(postfix, "cache", postfix.expressionCache())
+    return grid.grid()
+
+def refuseToCompile(monkeypatch):
+    def compileExpression(expression):
+        raise AssertionError("the stored compilation should have been used")
+    monkeypatch.setattr(postfix, "compileExpression", compileExpression)
+
+def saveCurves(tmp_path):
+    path = str(tmp_path / "session.json")
+    session.openStore(path)
+    numpy.save(tmp_path / "data.npy", numpy.arange(10.0) ** 2)
+    g = grid.grid()
+    g.addFuncFromString("x^2 - 3x", lineColor=(200, 0, 0), lineType=grid.linetype.dotted, lineWidth=4)
+    g.addFunc(grid.parametric(parse("t^2"), parse("2t"), (-3, 3), 500, name="sideways"))
+    g.addFunc(grid.implicit(parse("x^2 + y^2 - 100"), grid.funcSettings(visible=False), name="circle"))
+    g.addFunc(series.dataSeries(str(tmp_path / "data.npy"), x0=5, dx=0.5, name="squares"))
+    session.saveSession(g, path)
+    return g, path
+
+def testRoundTrip(tmp_path, monkeypatch):
+    saved, path = saveCurves(tmp_path)
+    loaded = restarted(monkeypatch)
+    refuseToCompile(monkeypatch)
+    assert session.loadSession(loaded, path) == 4
+    # the same curves, settings and expressions, in the same order
+    assert list(map(session.saveFunction, loaded.functions)) == list(map(session.saveFunction, saved.functions))
+    assert loaded.functions[0].settings == grid.funcSettings(grid.linetype.dotted, (200, 0, 0), 4)
+    assert loaded.functions[0].call(5) == saved.functions[0].call(5) == 10
+    numpy.testing.assert_array_equal(loaded.functions[1].sample(7)[1], saved.functions[1].sample(7)[1])
+    numpy.testing.assert_array_equal(loaded.functions[3].sample(5, 9.5, 100)[1], numpy.arange(10.0) ** 2)
+
+def testMissingOrUnreadableSession(tmp_path, capsys):
+    g = grid.grid()
+    assert session.loadSession(g, str(tmp_path / "missing.json")) == 0
+    (tmp_path / "broken.json").write_text("{\"format\":")
+    assert session.loadSession(g, str(tmp_path / "broken.json")) == 0
+    (tmp_path / "future.json").write_text("{\"format\": 2, \"functions\": []}")
+    assert session.loadSession(g, str(tmp_path / "future.json")) == 0
+    assert g.functions == [] and "session format 2" in capsys.readouterr().out
+
+def testStoreRoundTrip(tmp_path, monkeypatch):
+    path = str(tmp_path / "store")
+    store = postfix.compiledStore(path)
+    compiled = postfix.compileExpression(parse("x^3 - x"))
+    key = postfix.normalizeExpression(compiled.postfix)
+    store.add(key, compiled)
+    store.save()
+    refuseToCompile(monkeypatch)
+    loaded = postfix.compiledStore(path).get(key)
+    assert loaded.call(2) == 6
+    numpy.testing.assert_array_equal(loaded.callArray(numpy.arange(3.0)), [0, 0, 6])
+    assert loaded.call.source == compiled.call.source
+    assert postfix.compiledStore(path).get(postfix.normalizeExpression(parse("x"))) is None
+
+def writeStaleStore(tmp_path, version):
+    # a session for x^2 whose store has the code of x + 1 under x^2's key, as an older compiler might have made
+    path = str(tmp_path / "session.json")
+    key = postfix.normalizeExpression(parse("x^2"))
+    wrong = postfix.compileExpression(parse("x + 1"))
+    entries = {key: marshal.dumps((postfix.serializePostfix(wrong.postfix),
+            (wrong.call.__code__, wrong.call.source), (wrong.callArray.__code__, wrong.callArray.source)))}
+    with open(session.getStorePath(path), "wb") as file:
+        marshal.dump({"version": version, "entries": entries}, file)
+    g = grid.grid()
+    g.addFunc(grid.function(parse("x^2"), name="square"))
+    with open(path, "w") as file:
+        file.write(json.dumps({"format": session.formatVersion, "version": version,
+                "functions": [session.saveFunction(f) for f in g.functions]}))
+    return path
+
+def testStoreFromAnotherVersionIsDiscarded(tmp_path):
+    path = writeStaleStore(tmp_path, "an older postfix.py")
+    assert len(postfix.compiledStore(session.getStorePath(path))) == 0
+    g = grid.grid()
+    assert session.loadSession(g, path) == 1
+    # compiled again from the saved expression rather than run from the stale code
+    assert g.functions[0].call(3) == 9
+    numpy.testing.assert_array_equal(g.functions[0].callArray(numpy.array([3.0])), [9])
+    # and the next save replaces the store with this version's
+    session.saveSession(g, path)
+    store = postfix.compiledStore(session.getStorePath(path))
+    assert len(store) == 1 and store.get(postfix.normalizeExpression(parse("x^2"))).call(3) == 9
+
+def testStoreIsTrustedOnlyByVersion(tmp_path):
+    # the same stale store, claiming to be from this version, is run as it is; the version is all that guards it
+    path = writeStaleStore(tmp_path, postfix.getVersion())
+    g = grid.grid()
+    session.loadSession(g, path)
+    assert g.functions[0].call(3) == 4
+
+def testVersionFollowsTheSource(monkeypatch):
+    version = postfix.getVersion()
+    assert version == postfix.getVersion()
+    monkeypatch.setattr(postfix.importlib.util, "MAGIC_NUMBER", b"another python")
+    assert postfix.getVersion() != version
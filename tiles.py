@@ -0,0 +1,194 @@
+import pygame
+import grid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class tileCache:
+    # renders a grid as fixed-size screen tiles kept in a memory-bounded LRU cache and composes the view from them,
+    # so panning over ground already seen only costs blits. tiles are laid out on the pixel grid of the current zoom
+    # level, so a tile covers tileSize world units times the scale. the gridlines and every curve are tiled apart, as
+    # the layers of grid.getLayers, so adding or restyling one curve only redraws that curve's tiles.
+    # labels and markers depend on the whole view and are drawn on top.
+    tileSize = 256
+    maxBytes = 256 << 20
+
+    def __init__(self, renderable, tileSize=None, maxBytes=None, prefetch=True, onReady=None):
+        self.renderable = renderable
+        self.tileSize = tileSize or self.tileSize
+        self.maxBytes = maxBytes or self.maxBytes
+        self.prefetch = prefetch
+        self.onReady = onReady
+        self.tiles = OrderedDict() # (scale, view width, layer key, column, row): surface
+        self.pending = {} # same keys: future
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.surface = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def settings(self):
+        return self.renderable.settings
+
+    def getRevision(self):
+        return self.renderable.getRevision()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+                "tiles": len(self.tiles),
+                "bytes": self.bytes,
+                "maxBytes": self.maxBytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "pending": len(self.pending)
+                }
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+            self.bytes = 0
+
+    def getTileRect(self, column, row, scale):
+        # the world region a tile covers
+        size = self.tileSize
+        return (column * size * scale[0], row * size * scale[1], size * scale[0], size * scale[1])
+
+    def getOrigin(self, region):
+        # the view's top left corner on the pixel grid tiles are laid out on
+        return round(region.left / region.scaleX), round(region.top / region.scaleY)
+
+    def getTileRange(self, region, margin=0):
+        size = self.tileSize
+        left, top = self.getOrigin(region)
+        columns = range(left // size - margin, -(-(left + region.size[0]) // size) + margin)
+        rows = range(top // size - margin, -(-(top + region.size[1]) // size) + margin)
+        return columns, rows
+
+    def store(self, key, tile):
+        with self.lock:
+            if key in self.tiles:
+                return
+            self.tiles[key] = tile
+            self.bytes += tile.get_width() * tile.get_height() * tile.get_bytesize()
+            while self.bytes > self.maxBytes and len(self.tiles) > 1:
+                _, evicted = self.tiles.popitem(last=False)
+                self.bytes -= evicted.get_width() * evicted.get_height() * evicted.get_bytesize()
+
+    def lookup(self, key):
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+            return tile
+
+    def isKnown(self, key):
+        # whether the tile is cached or on its way
+        return key in self.pending or self.lookup(key) is not None
+
+    def renderTile(self, key, region, interactive, sampleRange=None, function=None, renderable=None):
+        # only tiles drawn from finished samples are kept; the others are drawn again once the samples land
+        scale, _, _, column, row = key
+        tile, complete = (renderable or self.renderable).renderTile(self.getTileRect(column, row, scale),
+                (self.tileSize, self.tileSize), region, interactive, sampleRange, function)
+        if complete:
+            self.store(key, tile)
+        return tile
+
+    def getTile(self, key, region, interactive, sampleRange=None, function=None):
+        tile = self.lookup(key)
+        if tile is not None:
+            self.hits += 1
+            return tile
+        self.misses += 1
+        future = self.pending.get(key)
+        if future is not None and future.done():
+            return future.result()
+        # not waited for when it is still being prefetched: drawn from whatever samples there are instead
+        return self.renderTile(key, region, interactive, sampleRange, function)
+
+    def prefetchAround(self, region, layers, interactive=False):
+        # full-detail tiles of every layer in a ring around the view, rendered in the background from a snapshot of
+        # the grid taken now, so settings changed before a tile is reached cannot end up cached under its key.
+        # tiles still queued for another view are dropped, and mid-gesture nothing new is queued, since the view
+        # will have moved on by the time they are done
+        columns, rows = self.getTileRange(region, margin=1)
+        scale = (region.scaleX, region.scaleY)
+        ring = {(scale, region.width, key, column, row) for key, _ in layers for column in columns for row in rows}
+        for key, future in list(self.pending.items()):
+            if key not in ring and future.cancel():
+                self.pending.pop(key, None)
+        if interactive:
+            return
+        copies = None
+        for key, _ in layers:
+            for column in columns:
+                for row in rows:
+                    tileKey = (scale, region.width, key, column, row)
+                    if tileKey in self.pending or self.lookup(tileKey) is not None:
+                        continue
+                    if copies is None:
+                        snapshot = self.renderable.snapshot()
+                        copies = dict(snapshot.getLayers(False))
+                    if key in copies:
+                        # held until the future is recorded, so a tile that finishes first cannot leave it behind
+                        with self.lock:
+                            self.pending[tileKey] = self.executor.submit(self.prefetchTile, tileKey, region, snapshot,
+                                    copies[key])
+
+    def prefetchTile(self, key, region, snapshot, function):
+        try:
+            return self.renderTile(key, region, False, function=function, renderable=snapshot)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+            if self.onReady is not None:
+                self.onReady()
+
+    def drawLayer(self, surface, region, key, fullKey, function, interactive, sampleRange):
+        scale = (region.scaleX, region.scaleY)
+        left, top = self.getOrigin(region)
+        columns, rows = self.getTileRange(region)
+        positions = [(column, row) for column in columns for row in rows]
+        cold = not any(self.isKnown((scale, region.width, layerKey, column, row))
+                for layerKey in {key, fullKey} for column, row in positions)
+        if cold and self.prefetch:
+            # nothing of this layer is cached, as on the first frame, a new zoom level or a new curve: one pass over the
+            # whole view samples and draws it once rather than once per tile, and prefetching fills in its tiles after
+            self.misses += len(positions)
+            whole = (left * region.scaleX, top * region.scaleY, region.width, region.height)
+            surface.blit(self.renderable.renderTile(whole, region.size, region, interactive, sampleRange, function)[0],
+                    (0, 0))
+            return
+        for column, row in positions:
+            # a full-detail tile is always good enough, even mid-gesture
+            tile = self.lookup((scale, region.width, fullKey, column, row))
+            if tile is None:
+                tile = self.getTile((scale, region.width, key, column, row), region, interactive, sampleRange, function)
+            else:
+                self.hits += 1
+            surface.blit(tile, (column * self.tileSize - left, row * self.tileSize - top))
+
+    def render(self, region, size=None, interactive=False):
+        region = grid.projection(region, size)
+        if self.surface is None or self.surface.get_size() != region.size:
+            self.surface = pygame.Surface(region.size)
+        surface = self.surface
+        self.renderable.prune()
+        layers = self.renderable.getLayers(interactive)
+        fullLayers = self.renderable.getLayers(False)
+        columns, _ = self.getTileRange(region)
+        # what every tile of this frame covers, sampled as one range so the tiles share their samples
+        sampleRange = (columns[0] * self.tileSize * region.scaleX, (columns[-1] + 1) * self.tileSize * region.scaleX)
+        for (key, function), (fullKey, _) in zip(layers, fullLayers):
+            self.drawLayer(surface, region, key, fullKey, function, interactive, sampleRange)
+        for overlay in (self.renderable.renderMarkers(region, region.size, interactive),
+                self.renderable.renderLabels(region, region.size, interactive)):
+            if overlay is not None:
+                surface.blit(overlay, (0, 0))
+        if self.prefetch:
+            self.prefetchAround(region, fullLayers, interactive)
+        return surface